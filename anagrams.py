@@ -0,0 +1,173 @@
+"""Anagram index: sorted-letter signature -> dictionary words with it.
+
+It answers "is this guess a valid anagram of the round word?" and "did the
+scramble come out as a real word?" with one hash lookup each.
+
+The index can be built offline into a compact file that is memory-mapped
+at startup instead of being rebuilt from the word list:
+
+    python -m anagrams build [words.txt] [anagrams.idx]
+
+File layout, all integers little endian:
+
+    header   b'ANAG', version u32, slots u32, data offset u32
+    table    `slots` entries of (crc32 of signature u32, record offset u32),
+             open addressing with linear probing, offset 0 means empty
+    records  signature length u8, signature, word count u16, the words
+             (each as long as the signature) back to back
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = os.getenv(
+    'ANAGRAM_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anagrams.idx'))
+
+_MAGIC = b'ANAG'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIII')
+_ENTRY = struct.Struct('<II')
+
+
+def signature(word):
+    """Sorted letters; two words are anagrams when these are equal."""
+    return ''.join(sorted(word))
+
+
+def _group(words):
+    groups = {}
+    for word in words:
+        groups.setdefault(signature(word), []).append(word)
+    return groups
+
+
+def write_index(words, path):
+    """Write the index file for an iterable of lowercase ASCII words."""
+    groups = _group(words)
+    slots = 1
+    while slots < 2 * len(groups):  # Keep the table at most half full
+        slots *= 2
+    data_offset = _HEADER.size + slots * _ENTRY.size
+    table = bytearray(slots * _ENTRY.size)
+    records = bytearray()
+    for key, members in groups.items():
+        encoded = key.encode('ascii')
+        crc = zlib.crc32(encoded)
+        slot = crc & (slots - 1)
+        while _ENTRY.unpack_from(table, slot * _ENTRY.size)[1]:
+            slot = (slot + 1) & (slots - 1)
+        _ENTRY.pack_into(table, slot * _ENTRY.size, crc,
+                         data_offset + len(records))
+        records += bytes((len(encoded), )) + encoded
+        records += struct.pack('<H', len(members))
+        records += b''.join(word.encode('ascii') for word in sorted(members))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, slots, data_offset))
+        f.write(table)
+        f.write(records)
+    os.replace(tmp_path, path)
+    return len(groups)
+
+
+class _MappedIndex:
+    """Read-only view of an index file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._slots, _ = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC or version != _VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not an anagram index")
+
+    def get(self, key):
+        try:
+            encoded = key.encode('ascii')
+        except UnicodeEncodeError:
+            return ()
+        crc = zlib.crc32(encoded)
+        mask = self._slots - 1
+        slot = crc & mask
+        data = self._map
+        while True:
+            entry_crc, offset = _ENTRY.unpack_from(
+                data, _HEADER.size + slot * _ENTRY.size)
+            if not offset:
+                return ()
+            length = data[offset]
+            if (entry_crc == crc and length == len(encoded)
+                    and data[offset + 1:offset + 1 + length] == encoded):
+                start = offset + 3 + length
+                (count, ) = struct.unpack_from('<H', data, start - 2)
+                return tuple(data[start + i * length:start +
+                                  (i + 1) * length].decode('ascii')
+                             for i in range(count))
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self._map.close()
+
+
+class AnagramIndex:
+    """Signature lookups over a mapped index file plus words added later."""
+
+    def __init__(self):
+        self._mapped = None
+        self._added = {}  # {signature: [words]} not in the file
+
+    def load(self, words, path=INDEX_FILE, words_file=None):
+        """Map the index file if it is current, else build from `words`.
+
+        `words` is any iterable of words, e.g. the word bank. The file is
+        used only when it is newer than `words_file`, so an edited word
+        list is never shadowed by a stale index.
+        """
+        self.close()
+        try:
+            stale = words_file is not None and os.path.getmtime(
+                path) < os.path.getmtime(words_file)
+            if not stale:
+                self._mapped = _MappedIndex(path)
+                logger.info(f"Mapped anagram index {path}")
+                return
+            logger.info(f"Anagram index {path} is older than {words_file}")
+        except (OSError, ValueError) as e:
+            logger.info(f"Building anagram index in memory: {e}")
+        self._added = _group(words)
+
+    def words(self, key):
+        """All known words whose signature is `key`."""
+        found = self._mapped.get(key) if self._mapped is not None else ()
+        extra = self._added.get(key)
+        return found + tuple(extra) if extra else found
+
+    def add(self, word):
+        if word not in self.words(signature(word)):
+            self._added.setdefault(signature(word), []).append(word)
+
+    def close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self._added = {}
+
+
+anagram_index = AnagramIndex()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        sys.exit(__doc__)
+    from wordbank import word_bank, WORDS_FILE
+    source = sys.argv[2] if len(sys.argv) > 2 else WORDS_FILE
+    target = sys.argv[3] if len(sys.argv) > 3 else INDEX_FILE
+    word_bank.load(source)
+    count = write_index(word_bank, target)
+    print(f"Wrote {count} signatures to {target}")
@@ -0,0 +1 @@
+"""Offline benchmarks for the bot handlers against local fake APIs."""
@@ -0,0 +1,222 @@
+"""Local stand-in for the Telegram Bot API and the word/dictionary APIs.
+
+A tiny keep-alive HTTP/1.1 server on asyncio. Paths are routed as:
+
+    /bot<token>/<method>          Telegram Bot API
+    /api/v2/entries/en/<word>     dictionaryapi.dev
+    /word?length=N&number=K       random-word-api
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import httpx
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Bench",
+    "username": "bench_bot"
+}
+
+
+class FakeApiServer:
+    """Answers Bot API calls with plausible results and counts them.
+
+    `latency` delays every Telegram call and `dictionary_latency` every
+    dictionary lookup, to mimic real round trips. When `record` is a list,
+    every Telegram call is appended to it as (monotonic_time, method, params).
+    Like Telegram, it posts updates to the URL given to setWebhook when
+    asked to `deliver` them.
+    """
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 latency=0.0,
+                 dictionary_latency=0.0,
+                 words=(),
+                 record=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.dictionary_latency = dictionary_latency
+        self.words = list(words)
+        self.record = record
+        self.calls = Counter()
+        self._message_ids = defaultdict(lambda: itertools.count(1))
+        self._server = None
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._webhook_client = None
+
+    @property
+    def base_url(self):
+        """Value for Application.builder().base_url()."""
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def dictionary_url(self):
+        return f"http://{self.host}:{self.port}/api/v2/entries/en/{{word}}"
+
+    @property
+    def word_url(self):
+        return (f"http://{self.host}:{self.port}"
+                "/word?length={length}&number={count}")
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def deliver(self, update):
+        """POST an update to the webhook and return the HTTP status."""
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient(timeout=10.0)
+        headers = {}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        response = await self._webhook_client.post(self.webhook_url,
+                                                    json=update,
+                                                    headers=headers)
+        return response.status_code
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self._route(
+                    target, headers.get('content-type', ''), body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    "Connection: keep-alive\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, target, content_type, body):
+        url = urlsplit(target)
+        if url.path.startswith('/bot'):
+            return await self._bot_api(url.path, content_type, body)
+        if url.path.startswith('/api/v2/entries/en/'):
+            return await self._dictionary(unquote(url.path.rsplit('/', 1)[1]))
+        if url.path.startswith('/word'):
+            return self._random_words(dict(parse_qsl(url.query)))
+        return 404, {"ok": False, "description": "Not Found"}
+
+    @staticmethod
+    def _params(content_type, body):
+        if not body:
+            return {}
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        params = {}
+        for key, value in parse_qsl(body.decode()):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def _bot_api(self, path, content_type, body):
+        api_method = path.rsplit('/', 1)[1]
+        params = self._params(content_type, body)
+        self.calls[api_method] += 1
+        if self.record is not None:
+            self.record.append((time.monotonic(), api_method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, {"ok": True, "result": self._result(api_method, params)}
+
+    def _message(self, chat_id, text):
+        return {
+            "message_id": next(self._message_ids[chat_id]),
+            "date": int(time.time()),
+            "chat": {
+                "id": chat_id,
+                "type": "private" if chat_id > 0 else "group"
+            },
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    def _result(self, api_method, params):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method in ('sendMessage', 'editMessageText'):
+            return self._message(int(params.get('chat_id', 0)),
+                                 params.get('text', ''))
+        if api_method == 'getChat':
+            chat_id = int(params['chat_id'])
+            return {
+                "id": chat_id,
+                "type": "private",
+                "first_name": f"User{chat_id}"
+            }
+        if api_method == 'getUpdates':
+            return []
+        if api_method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+        elif api_method == 'deleteWebhook':
+            self.webhook_url = self.webhook_secret = None
+        return True
+
+    async def _dictionary(self, word):
+        if self.dictionary_latency:
+            await asyncio.sleep(self.dictionary_latency)
+        return 200, [{
+            "word":
+            word,
+            "meanings": [{
+                "definitions": [{
+                    "definition": f"A benchmark definition of {word}."
+                }]
+            }]
+        }]
+
+    def _random_words(self, query):
+        length = int(query.get('length', 5))
+        count = int(query.get('number', 1))
+        candidates = [word for word in self.words if len(word) == length]
+        if not candidates:
+            return 200, []
+        return 200, [random.choice(candidates) for _ in range(count)]
@@ -0,0 +1,134 @@
+"""Recorded sessions: incoming updates and outbound calls, with timestamps.
+
+A trace is JSON lines. The first line is a header with the settings that
+decide which words are played; then every update fed to the bot and every
+Bot API call it made, in time order, `t` seconds after the first update:
+
+    {"header": {"RANDOM_SEED": "1", "ADAPTIVE_DIFFICULTY": "0", ...}}
+    {"t": 0.0012, "chat": -1000, "update": {...}}
+    {"t": 0.0031, "chat": -1000, "call": "sendMessage", "params": {...}}
+
+Replaying feeds the updates back in per-chat order, each chat on its own
+task, at `speed` times the recorded pace (0 means as fast as possible).
+With the same seed every game draws the same words and scrambles, so the
+recorded guesses are still right. Solve times are measured, not recorded,
+which makes adaptive difficulty and the points diverge; record with
+ADAPTIVE_DIFFICULTY=0 (the default for --record) and compare the sent
+text with its numbers masked. The all-time leaderboard also depends on
+when other chats finished, so a few of its lines differ between runs.
+"""
+import asyncio
+import json
+import re
+import time
+from collections import Counter, defaultdict
+
+from webhook import chat_key
+
+# Settings stored in the header and restored before replaying
+TRACED_ENV = ('RANDOM_SEED', 'ADAPTIVE_DIFFICULTY', 'ROUND_TIMEOUT',
+              'HINT_COOLDOWN')
+_NUMBER = re.compile(r"\d+(\.\d+)?")
+
+
+def write_trace(path, env, updates, calls):
+    """Save [(monotonic, update)] and [(monotonic, method, params)]."""
+    begin = min([when for when, _ in updates] or [0.0])
+    lines = [(when - begin, {
+        "chat": chat_key(update),
+        "update": update
+    }) for when, update in updates]
+    lines += [(when - begin, {
+        "chat": params.get('chat_id'),
+        "call": method,
+        "params": params
+    }) for when, method, params in calls]
+    lines.sort(key=lambda line: line[0])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"header": env}) + '\n')
+        for offset, line in lines:
+            f.write(json.dumps(dict(t=round(offset, 6), **line)) + '\n')
+    return len(updates), len(calls)
+
+
+class Trace:
+    """A trace read back: header, updates per chat, and the recorded calls."""
+
+    def __init__(self, path):
+        self.header = {}
+        self.updates = defaultdict(list)  # {chat_id: [(t, update)]}
+        self.calls = []  # [(chat_id, method, params)]
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'header' in record:
+                    self.header = record['header']
+                elif 'update' in record:
+                    self.updates[record['chat']].append(
+                        (record['t'], record['update']))
+                elif 'call' in record:
+                    self.calls.append(
+                        (record['chat'], record['call'], record['params']))
+                else:
+                    raise ValueError(f"{path}:{line_number}: unknown record")
+
+    def __len__(self):
+        return sum(len(updates) for updates in self.updates.values())
+
+    def chat_ids(self):
+        return list(self.updates)
+
+    @property
+    def duration(self):
+        return max((updates[-1][0] for updates in self.updates.values()),
+                   default=0.0)
+
+
+async def replay(trace, feed, speed=0.0):
+    """Feed every chat's updates in order, chats concurrently.
+
+    With a speed, an update is not fed before its recorded time divided
+    by the speed; a slow bot only makes the replay late, never reorders it.
+    """
+    begin = time.monotonic()
+
+    async def play_chat(updates):
+        for offset, update in updates:
+            if speed > 0:
+                delay = begin + offset / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await feed(update)
+
+    await asyncio.gather(*(play_chat(updates)
+                           for updates in trace.updates.values()))
+
+
+def _sent_lines(calls):
+    """Counter of (chat_id, method, line) over the text of the calls.
+
+    Compared by line because the outbox merges messages that pile up, and
+    how many do depends on timing. Numbers are masked, since points and
+    solve times are measured on replay.
+    """
+    lines = Counter()
+    for chat_id, method, params in calls:
+        for line in str(params.get('text', '')).splitlines():
+            if line:
+                lines[(chat_id, method, _NUMBER.sub('#', line))] += 1
+    return lines
+
+
+def compare_calls(recorded, replayed):
+    """(matching, recorded, replayed) counts of lines of sent text.
+
+    Both are [(chat_id, method, params)]; lines are matched per chat
+    regardless of order, since delayed definitions may go out before or
+    after the next round.
+    """
+    expected = _sent_lines(recorded)
+    actual = _sent_lines(replayed)
+    matching = sum((expected & actual).values())
+    return matching, sum(expected.values()), sum(actual.values())
@@ -0,0 +1,362 @@
+"""Replay synthetic games through the real handlers and report throughput.
+
+Everything runs offline: the bot talks to a local FakeApiServer instead of
+Telegram, and definitions come from its fake dictionary endpoint.
+
+    python -m bench.run_benchmark --chats 200 --players 5
+
+Runs are seeded (--seed), so the same arguments play the same words. A run
+can be recorded and replayed against another build, faster than it was
+recorded, comparing the per-handler timings of both:
+
+    python -m bench.run_benchmark --record run.jsonl --save-timings old.json
+    python -m bench.run_benchmark --replay run.jsonl --speed 4 \
+        --compare old.json
+"""
+import argparse
+import asyncio
+import functools
+import gc
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.fake_api import FakeApiServer  # noqa: E402
+from bench.replay import (TRACED_ENV, Trace, compare_calls,  # noqa: E402
+                          replay, write_trace)
+from bench.workload import UpdateFactory, play_game  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyRecorder:
+    """Wraps coroutine functions and records how long each call takes."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, name, func):
+
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[name].append(time.perf_counter() - start)
+
+        return timed
+
+    def summary(self):
+        """{handler: {calls, p50, p99, max}} in seconds, for saving."""
+        return {
+            name: {
+                'calls': len(values),
+                'p50': percentile(values, 0.5),
+                'p99': percentile(values, 0.99),
+                'max': max(values),
+            }
+            for name, values in sorted(self.samples.items())
+        }
+
+    def compare(self, baseline):
+        """p50 and p99 of this run next to a saved summary."""
+        lines = [
+            f"{'handler':<16}{'p50 ms':>10}{'was':>10}{'change':>9}"
+            f"{'p99 ms':>10}{'was':>10}{'change':>9}"
+        ]
+        for name, now in self.summary().items():
+            was = baseline.get(name)
+            line = f"{name:<16}"
+            for stat in ('p50', 'p99'):
+                line += f"{now[stat] * 1000:>10.3f}"
+                if was and was[stat]:
+                    line += (f"{was[stat] * 1000:>10.3f}"
+                             f"{now[stat] / was[stat] - 1:>+9.0%}")
+                else:
+                    line += f"{'-':>10}{'':>9}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def report(self):
+        lines = [
+            f"{'handler':<16}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}"
+            f"{'max ms':>10}"
+        ]
+        for name, values in sorted(self.samples.items()):
+            lines.append(f"{name:<16}{len(values):>8}"
+                         f"{percentile(values, 0.5) * 1000:>10.3f}"
+                         f"{percentile(values, 0.99) * 1000:>10.3f}"
+                         f"{max(values) * 1000:>10.3f}")
+        return "\n".join(lines)
+
+
+def instrument(main, application, recorder):
+    """Time every handler callback plus next_round and end_game."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = recorder.wrap(handler.callback.__name__,
+                                             handler.callback)
+    # check_answer and friends look these up as module globals
+    main.next_round = recorder.wrap("next_round", main.next_round)
+    main.end_game = recorder.wrap("end_game", main.end_game)
+
+
+async def run(args):
+    # Configure the bot before importing it
+    trace = None
+    if args.replay:
+        trace = Trace(args.replay)
+        # Play the recorded words: same seed, same difficulty settings
+        for name, value in trace.header.items():
+            if value is not None:
+                os.environ[name] = value
+    os.environ.setdefault('RANDOM_SEED', str(args.seed))
+    if args.record:
+        # Adapting to measured solve times would change the words on replay
+        os.environ.setdefault('ADAPTIVE_DIFFICULTY', '0')
+    workdir = tempfile.mkdtemp(prefix="anagram-bench-")
+    os.environ.setdefault('BOT_DB', os.path.join(workdir, 'bot.db'))
+    os.environ.setdefault('DEFINITIONS_DB',
+                          os.path.join(workdir, 'definitions.db'))
+    os.environ.setdefault('EVENT_LOG', os.path.join(workdir, 'events.log'))
+    os.environ.setdefault('ROUND_TIMEOUT', '3600')
+    os.environ.setdefault('HINT_COOLDOWN', '0')
+    if not args.telegram_limits:
+        # The fake API has no flood limits; measure the bot, not the pacing
+        for name in ('SEND_GLOBAL_RATE', 'SEND_CHAT_RATE', 'SEND_GROUP_RATE'):
+            os.environ.setdefault(name, '1000000')
+
+    import logging
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    import definitions
+    import main
+    from telegram import Update
+
+    main.load_words()
+    calls = [] if args.record or args.replay else None
+    server = FakeApiServer(latency=args.api_latency / 1000,
+                           dictionary_latency=args.dictionary_latency / 1000,
+                           record=calls)
+    await server.start()
+    definitions.DICTIONARY_URL = server.dictionary_url
+
+    application = main.build_application("123:bench",
+                                         base_url=server.base_url,
+                                         polling=not args.webhook)
+    recorder = LatencyRecorder()
+    instrument(main, application, recorder)
+
+    updates = 0
+    recorded = [] if args.record else None
+
+    def count(data):
+        nonlocal updates
+        updates += 1
+        if recorded is not None:
+            recorded.append((time.monotonic(), data))
+
+    if args.webhook:
+        # Updates take the real path: fake Telegram -> Flask -> inbox
+        import keep_alive
+        from webhook import WEBHOOK_PATH, chat_key, inbox
+        port = free_port()
+        keep_alive.keep_alive(port)
+        webhook_task = asyncio.create_task(
+            main.run_webhook(application,
+                             f"http://127.0.0.1:{port}{WEBHOOK_PATH}"))
+        while server.webhook_url is None:
+            await asyncio.sleep(0.01)
+
+        async def feed(data):
+            count(data)
+            while await server.deliver(data) == 503:
+                await asyncio.sleep(0.01)
+            await inbox.settle(chat_key(data))
+    else:
+        await application.initialize()
+        await main.post_init(application)
+
+        async def feed(data):
+            count(data)
+            await application.process_update(
+                Update.de_json(data, application.bot))
+
+    # All games start first, then memory is measured, then they are played
+    chat_ids = [-(1000 + i) for i in range(args.chats)]
+    chat_ids += [10**6 + i for i in range(args.solo)]
+    all_started = asyncio.Event()
+    started = set()
+    memory = {}
+
+    async def game_started(chat_id):
+        started.add(chat_id)
+        if len(started) == len(chat_ids):
+            gc.collect()
+            games = list(main.active_games.values())
+            memory['games'] = len(games)
+            memory['slots'] = sum(game.memory_size() for game in games)
+            if args.tracemalloc:
+                memory['traced'] = tracemalloc.get_traced_memory()[0]
+            all_started.set()
+        await all_started.wait()
+
+    factory = UpdateFactory()
+    rng = random.Random(args.seed)
+
+    def players_for(chat_id):
+        if chat_id > 0:
+            return [chat_id]
+        return [abs(chat_id) * 100 + i for i in range(args.players)]
+
+    if args.tracemalloc:
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    begin = time.perf_counter()
+    if trace is not None:
+        await replay(trace, feed, args.speed)
+    else:
+        await asyncio.gather(*(play_game(feed,
+                                         factory,
+                                         main.active_games,
+                                         chat_id,
+                                         players_for(chat_id),
+                                         random.Random(rng.random()),
+                                         rounds=str(args.rounds),
+                                         wrong_guesses=args.wrong_guesses,
+                                         chatter=args.chatter,
+                                         hint_rate=args.hint_rate,
+                                         started=game_started)
+                               for chat_id in chat_ids))
+    elapsed = time.perf_counter() - begin
+
+    # Let delayed definition messages go out before shutting down
+    await asyncio.sleep(main.MEANING_DELAY + 0.2)
+    await main.post_stop(application)
+    if args.webhook:
+        webhook_task.cancel()
+        await asyncio.gather(webhook_task, return_exceptions=True)
+    else:
+        await main.post_shutdown(application)
+        await application.shutdown()
+    await server.stop()
+
+    games = memory.get('games') or 1
+    if trace is not None:
+        print(f"replayed {args.replay}: {len(trace.chat_ids())} chats, "
+              f"recorded over {trace.duration:.2f}s, "
+              f"speed {args.speed or 'unlimited'}")
+    else:
+        print(f"chats: {args.chats} group + {args.solo} solo, "
+              f"{args.players} players per group, {args.rounds} rounds")
+    print(f"updates: {updates} in {elapsed:.2f}s "
+          f"= {updates / elapsed:.0f} updates/sec")
+    print()
+    if args.compare:
+        with open(args.compare) as f:
+            print(recorder.compare(json.load(f)))
+    else:
+        print(recorder.report())
+    if args.save_timings:
+        with open(args.save_timings, 'w') as f:
+            json.dump(recorder.summary(), f, indent=2)
+    if args.record:
+        env = {name: os.environ.get(name) for name in TRACED_ENV}
+        write_trace(args.record, env, recorded, calls)
+        print(f"\nrecorded {len(recorded)} updates and {len(calls)} calls "
+              f"to {args.record}")
+    if trace is not None:
+        matching, expected, actual = compare_calls(
+            trace.calls, [(params.get('chat_id'), method, params)
+                          for _, method, params in calls])
+        print(f"\nlines of sent text matching the recording: {matching} "
+              f"of {expected} recorded, {actual} sent")
+    print()
+    print("Telegram API calls: " + ", ".join(
+        f"{name}={count}" for name, count in sorted(server.calls.items())))
+    if memory:
+        print(f"memory per active game: {memory['slots'] / games:.0f} "
+              "bytes (GameState.memory_size)")
+    if args.tracemalloc and memory:
+        print(f"traced memory per active game: "
+              f"{(memory['traced'] - baseline) / games:.0f} bytes")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KB")
+    if args.metrics:
+        from keep_alive import app
+        print()
+        print(app.test_client().get('/metrics').get_data(as_text=True))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=100,
+                        help="group chats playing at once")
+    parser.add_argument("--solo", type=int, default=0,
+                        help="private solo games playing at once")
+    parser.add_argument("--players", type=int, default=5,
+                        help="guessers per group chat")
+    parser.add_argument("--rounds", type=int, choices=(10, 30, 50),
+                        default=10)
+    parser.add_argument("--wrong-guesses", type=int, default=2,
+                        help="wrong anagrams sent per round")
+    parser.add_argument("--chatter", type=int, default=2,
+                        help="non-guess messages per round")
+    parser.add_argument("--hint-rate", type=float, default=0.3,
+                        help="probability of a /hint per round")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="fake Telegram round trip in ms")
+    parser.add_argument("--dictionary-latency", type=float, default=0.0,
+                        help="fake dictionary round trip in ms")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also measure memory per game with tracemalloc")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="keep the real per-chat and global send rates")
+    parser.add_argument("--webhook", action="store_true",
+                        help="deliver updates through the webhook server")
+    parser.add_argument("--metrics", action="store_true",
+                        help="print the /metrics page at the end")
+    parser.add_argument("--verbose", action="store_true",
+                        help="keep the bot's logging, which is noisy")
+    parser.add_argument("--record", metavar="FILE",
+                        help="save the updates and Bot API calls as a trace")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="feed a recorded trace instead of new games")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="replay at this multiple of the recorded pace "
+                        "(default: as fast as possible)")
+    parser.add_argument("--save-timings", metavar="FILE",
+                        help="write the per-handler timings as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="show timings next to ones saved earlier")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
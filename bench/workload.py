@@ -0,0 +1,106 @@
+"""Synthetic Telegram updates and the chat scenarios that replay them."""
+import itertools
+import time
+
+
+class UpdateFactory:
+    """Builds raw update dicts, as Telegram would deliver them."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _chat(chat_id):
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": "Solo"}
+        return {"id": chat_id, "type": "group", "title": f"Group {chat_id}"}
+
+    @staticmethod
+    def _user(user_id):
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"Player{user_id}"
+        }
+
+    def message(self, chat_id, user_id, text):
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith('/'):
+            message["entities"] = [{
+                "type": "bot_command",
+                "offset": 0,
+                "length": len(text.split()[0])
+            }]
+        return {"update_id": next(self._ids), "message": message}
+
+    def callback(self, chat_id, user_id, data):
+        return {
+            "update_id": next(self._ids),
+            "callback_query": {
+                "id": str(next(self._ids)),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "from": self._user(user_id),
+                "message": {
+                    "message_id": next(self._ids),
+                    "date": int(time.time()),
+                    "chat": self._chat(chat_id),
+                    "text": "Choose difficulty:",
+                },
+            },
+        }
+
+
+CHATTER = [
+    "lol", "who is winning?", "this one is hard", "brb",
+    "good game everyone", "again!", "no idea", "so close"
+]
+
+
+async def play_game(feed, factory, games, chat_id, players, rng, *,
+                    difficulty="easy", rounds="10", wrong_guesses=2,
+                    chatter=2, hint_rate=0.3, started=None):
+    """Play one full game in chat_id through `feed(update_dict)`.
+
+    `games` is the bot's active_games mapping, used as an oracle for the
+    current word. `started`, if given, is awaited after the first round
+    is on screen so callers can line up all games before measuring.
+    """
+    host = players[0]
+    solo = chat_id > 0
+    await feed(factory.message(chat_id, host,
+                               "/newplay" if solo else "/newgame"))
+    await feed(factory.callback(chat_id, host,
+                                f"{difficulty}_solo" if solo else difficulty))
+    await feed(factory.callback(chat_id, host, rounds))
+    if started is not None:
+        await started(chat_id)
+
+    while True:
+        game = games.get(chat_id)
+        if game is None:
+            break
+        word = game.current_word
+        if not word:
+            break
+        for _ in range(chatter):
+            await feed(
+                factory.message(chat_id, rng.choice(players),
+                                rng.choice(CHATTER)))
+        for _ in range(wrong_guesses):
+            guess = ''.join(rng.sample(word, len(word)))
+            if guess != word:
+                await feed(factory.message(chat_id, rng.choice(players),
+                                           guess))
+        if rng.random() < hint_rate:
+            await feed(factory.message(chat_id, rng.choice(players), "/hint"))
+        await feed(factory.message(chat_id, rng.choice(players), word))
+
+    await feed(factory.message(chat_id, host, "/leaderboard"))
+    await feed(factory.message(chat_id, rng.choice(players), "/stats"))
@@ -0,0 +1,323 @@
+"""Export and import the bot's SQLite data as CSV or JSON lines.
+
+    python -m datatool export TABLE [-o FILE] [--format csv|jsonl] [--ranked]
+    python -m datatool import TABLE FILE [--format csv|jsonl] [--add]
+                                         [--dry-run]
+
+TABLE is one of global_stats, word_ratings, user_data, chat_data and
+bot_data; the pickled `data` of the last three is written as JSON. Rows are
+streamed in batches both ways, so memory stays flat however many users
+there are. Exports read one WAL snapshot and can run next to the bot.
+
+Imports commit every --batch rows and report invalid rows by line without
+stopping; --dry-run only validates. Into an empty table the indexes are
+dropped and built once at the end, which is several times faster. The
+running bot keeps its own copy of the users it has seen, so import into a
+stopped bot (or a new database, see BOT_DB) unless the rows are for users
+it has not touched. --add adds global_stats points and games to the stored
+totals instead of replacing them, e.g. to merge two databases. Exit status
+is 1 if any row was invalid.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import pickle
+import sys
+
+from storage import DB_FILE, SQLiteStore, _SCHEMA, _UPSERTS
+
+BATCH_SIZE = 10000
+IMPORT_CACHE_KB = 64 * 1024
+# The leaderboard order, served by the global_stats_rank index
+RANK_ORDER = "points DESC, user_id"
+# Invalid rows printed before only counting the rest
+MAX_REPORTED_ERRORS = 20
+
+
+def _integer(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"expected an integer, got {value!r}")
+    return int(value)
+
+
+def _real(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"expected a number, got {value!r}")
+    return float(value)
+
+
+def _text(value):
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"expected text, got {value!r}")
+    return value
+
+
+def _key(value):
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"expected a non-empty key, got {value!r}")
+    return value
+
+
+def _count(value):
+    value = _integer(value)
+    if value < 0:
+        raise ValueError(f"expected a count of at least 0, got {value}")
+    return value
+
+
+def _blob(value):
+    # CSV cells hold the JSON text, JSON lines the decoded value
+    if isinstance(value, str):
+        value = json.loads(value)
+    return pickle.dumps(value)
+
+
+def _user_blob(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError(f"expected a JSON object, got {value!r}")
+    return pickle.dumps(value)
+
+
+class Table:
+    """Columns of a table, how to read them back, and its export query."""
+
+    def __init__(self, name, columns, parsers):
+        self.name = name
+        self.columns = columns
+        self.parsers = parsers
+        self.blob = columns[-1] == 'data'
+
+    def select(self, ranked=False):
+        # Key order makes a later import append instead of seeking
+        order = RANK_ORDER if ranked else self.columns[0]
+        return (f"SELECT {', '.join(self.columns)} FROM {self.name} "
+                f"ORDER BY {order}")
+
+    def parse(self, record):
+        """Validate an exported record into a row for the upsert."""
+        if isinstance(record, dict):
+            missing = [column for column in self.columns
+                       if column not in record]
+            if missing:
+                raise ValueError(f"missing {', '.join(missing)}")
+            values = [record[column] for column in self.columns]
+        else:
+            if len(record) != len(self.columns):
+                raise ValueError(f"expected {len(self.columns)} columns, "
+                                 f"got {len(record)}")
+            values = record
+        return tuple([parse(value)
+                      for parse, value in zip(self.parsers, values)])
+
+
+TABLES = {
+    table.name: table
+    for table in (
+        Table('global_stats', ('user_id', 'points', 'games_played', 'name'),
+              (_integer, _count, _count, _text)),
+        Table('word_ratings', ('word', 'total_seconds', 'rounds'),
+              (_key, _real, _count)),
+        Table('user_data', ('user_id', 'data'), (_integer, _user_blob)),
+        Table('chat_data', ('chat_id', 'data'), (_integer, _user_blob)),
+        Table('bot_data', ('key', 'data'), (_key, _blob)),
+    )
+}
+
+
+def _format(args, path):
+    if args.format:
+        return args.format
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def _open(path, mode):
+    if path == '-':
+        stream = sys.stdout if mode == 'w' else sys.stdin
+        return contextlib.nullcontext(stream)
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def export_rows(db, table, ranked=False, batch_size=BATCH_SIZE):
+    """Yield the rows of a table a batch at a time, blobs unpickled."""
+    cursor = db.execute(table.select(ranked))
+    for rank in itertools.count(1, batch_size):
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        if table.blob:
+            rows = [row[:-1] + (pickle.loads(row[-1]), ) for row in rows]
+        if ranked:
+            rows = [(index, ) + tuple(row)
+                    for index, row in enumerate(rows, rank)]
+        yield rows
+
+
+def export(args):
+    table = TABLES[args.table]
+    columns = (('rank', ) if args.ranked else ()) + table.columns
+    fmt = _format(args, args.output)
+    db = SQLiteStore(args.db).connect()
+    count = 0
+    # One read transaction, so the export is a consistent snapshot
+    db.execute("BEGIN")
+    try:
+        with _open(args.output, 'w') as out:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(columns)
+            for rows in export_rows(db, table, args.ranked, args.batch):
+                if fmt == 'csv':
+                    if table.blob:
+                        rows = [row[:-1] + (json.dumps(row[-1]), )
+                                for row in rows]
+                    writer.writerows(rows)
+                else:
+                    out.writelines(
+                        json.dumps(dict(zip(columns, row))) + '\n'
+                        for row in rows)
+                count += len(rows)
+    finally:
+        db.rollback()
+    print(f"Exported {count} rows from {table.name}", file=sys.stderr)
+    return 0
+
+
+def read_records(path, fmt, table):
+    """Yield (line number, record) from a CSV or JSON lines file.
+
+    CSV rows come as lists in the table's column order. JSON lines are
+    yielded undecoded, so a bad line fails on its own.
+    """
+    with _open(path, 'r') as f:
+        if fmt == 'csv':
+            reader = csv.reader(f)
+            header = next(reader, [])
+            missing = [column for column in table.columns
+                       if column not in header]
+            if missing:
+                sys.exit(f"{path} has no {', '.join(missing)} column")
+            positions = [header.index(column) for column in table.columns]
+            for row in reader:
+                if len(row) != len(header):
+                    yield reader.line_num, row  # Rejected by Table.parse
+                else:
+                    yield reader.line_num, [row[i] for i in positions]
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, line
+
+
+def _load(records, table, write, batch_size):
+    """Parse records and write them in batches, returns (rows, invalid)."""
+    imported = invalid = 0
+    batch = []
+    for line_number, record in records:
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+            batch.append(table.parse(record))
+        except (ValueError, TypeError) as e:
+            invalid += 1
+            if invalid <= MAX_REPORTED_ERRORS:
+                print(f"line {line_number}: {e}", file=sys.stderr)
+            continue
+        if len(batch) >= batch_size:
+            write(batch)
+            imported += len(batch)
+            batch = []
+    write(batch)
+    return imported + len(batch), invalid
+
+
+def import_(args):
+    table = TABLES[args.table]
+    if args.add and table.name != 'global_stats':
+        sys.exit("--add only applies to global_stats")
+    upsert = _UPSERTS['global_stats_delta' if args.add else table.name]
+    records = read_records(args.input, _format(args, args.input), table)
+    if args.dry_run:
+        imported, invalid = _load(records, table, lambda batch: None,
+                                  args.batch)
+        print(f"Validated {imported} rows for {table.name}, "
+              f"{invalid} invalid", file=sys.stderr)
+        return 1 if invalid else 0
+
+    db = SQLiteStore(args.db).connect()
+    # Rows rarely arrive in key order; a bigger page cache saves reads
+    db.execute(f"PRAGMA cache_size = -{IMPORT_CACHE_KB}")
+    bulk = not db.execute(f"SELECT 1 FROM {table.name} LIMIT 1").fetchall()
+    if bulk:
+        # Filling an empty table: building its indexes once at the end is
+        # several times faster than updating them row by row
+        indexes = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name = ? AND sql IS NOT NULL", (table.name, )).fetchall()
+        for (name, ) in indexes:
+            db.execute(f"DROP INDEX {name}")
+
+    def write(batch):
+        if batch:
+            with db:
+                db.executemany(upsert, batch)
+
+    try:
+        imported, invalid = _load(records, table, write, args.batch)
+    finally:
+        if bulk:
+            db.executescript(_SCHEMA)
+    print(f"Imported {imported} rows into {table.name}, {invalid} invalid",
+          file=sys.stderr)
+    return 1 if invalid else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m datatool",
+                                     description=__doc__.split('\n')[0])
+    parser.add_argument("--db", default=DB_FILE,
+                        help=f"database file (default {DB_FILE})")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE,
+                        help="rows per read or committed write")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write a table out")
+    export_parser.add_argument("table", choices=TABLES)
+    export_parser.add_argument("-o", "--output", default='-')
+    export_parser.add_argument("--format", choices=("csv", "jsonl"))
+    export_parser.add_argument(
+        "--ranked", action="store_true",
+        help="add a leaderboard rank column (global_stats)")
+    export_parser.set_defaults(run=export)
+
+    import_parser = commands.add_parser("import", help="read a table in")
+    import_parser.add_argument("table", choices=TABLES)
+    import_parser.add_argument("input")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+    import_parser.add_argument(
+        "--add", action="store_true",
+        help="add global_stats points to the stored totals")
+    import_parser.add_argument("--dry-run", action="store_true",
+                               help="validate without writing")
+    import_parser.set_defaults(run=import_)
+
+    args = parser.parse_args(argv)
+    if (args.command == 'export' and args.ranked
+            and args.table != 'global_stats'):
+        parser.error("--ranked only applies to global_stats")
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # The reader went away, e.g. `| head`
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
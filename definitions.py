@@ -0,0 +1,169 @@
+"""Definition lookups with an in-memory LRU in front of an SQLite store."""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+NO_DEFINITION = "No definition available"
+DICTIONARY_URL = os.getenv(
+    'DICTIONARY_URL', "https://api.dictionaryapi.dev/api/v2/entries/en/{word}")
+
+DB_FILE = os.getenv('DEFINITIONS_DB', 'definitions.db')
+MAX_MEMORY_ENTRIES = 5000
+# Words the dictionary does not know are retried after this many seconds
+NEGATIVE_TTL = 7 * 24 * 3600
+
+
+class LookupFailed(Exception):
+    """The dictionary could not be reached, so the result must not be cached."""
+
+
+async def fetch_definition(word):
+    """Fetches word meaning from Free Dictionary API, None if it has none"""
+    try:
+        response = await http_client.get(DICTIONARY_URL.format(word=word))
+    except Exception as e:
+        raise LookupFailed(str(e)) from e
+
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise LookupFailed(f"HTTP {response.status_code}")
+
+    data = response.json()
+    if isinstance(data, list) and len(data) > 0:
+        meanings = data[0].get("meanings", [])
+        if meanings:
+            definitions = meanings[0].get("definitions", [])
+            if definitions:
+                return definitions[0].get("definition", "No definition found")
+    return None
+
+
+class DefinitionCache:
+    """Bounded LRU of definitions backed by a persistent SQLite table.
+
+    A cached value of None means the dictionary has no entry for the word.
+    """
+
+    def __init__(self,
+                 path=DB_FILE,
+                 max_entries=MAX_MEMORY_ENTRIES,
+                 negative_ttl=NEGATIVE_TTL,
+                 fetch=fetch_definition):
+        self.path = path
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.fetch = fetch
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # {word: (definition, fetched_at)}
+        self._in_flight = {}  # {word: asyncio.Task} for fetches under way
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS definitions ("
+                             "word TEXT PRIMARY KEY, "
+                             "definition TEXT, "
+                             "fetched_at REAL NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    def _expired(self, definition, fetched_at):
+        return (definition is None
+                and time.time() - fetched_at > self.negative_ttl)
+
+    def _remember(self, word, definition, fetched_at):
+        self._memory[word] = (definition, fetched_at)
+        self._memory.move_to_end(word)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, word):
+        """Return (found, definition) from memory or disk without fetching."""
+        with self._lock:
+            entry = self._memory.get(word)
+            if entry is not None and not self._expired(*entry):
+                self._memory.move_to_end(word)
+                return True, entry[0]
+
+            try:
+                row = self._connect().execute(
+                    "SELECT definition, fetched_at FROM definitions "
+                    "WHERE word = ?", (word, )).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read definition of {word}: {e}")
+                row = None
+            if row is not None and not self._expired(*row):
+                self._remember(word, *row)
+                return True, row[0]
+        return False, None
+
+    def store(self, word, definition):
+        """Cache a definition (None for unknown words) in memory and on disk."""
+        fetched_at = time.time()
+        with self._lock:
+            self._remember(word, definition, fetched_at)
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO definitions "
+                    "(word, definition, fetched_at) VALUES (?, ?, ?)",
+                    (word, definition, fetched_at))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to store definition of {word}: {e}")
+
+    async def get(self, word):
+        """Return the definition of word, fetching and caching it on a miss."""
+        word = word.lower()
+        found, definition = self.lookup(word)
+        if found:
+            self.hits += 1
+            return definition or NO_DEFINITION
+
+        # Concurrent misses for the same word share a single fetch, which
+        # runs as its own task so a cancelled caller does not abort it
+        pending = self._in_flight.get(word)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._fetch_and_store(word))
+            self._in_flight[word] = pending
+            pending.add_done_callback(
+                lambda _: self._in_flight.pop(word, None))
+        definition = await asyncio.shield(pending)
+        return definition or NO_DEFINITION
+
+    async def _fetch_and_store(self, word):
+        try:
+            definition = await self.fetch(word)
+        except LookupFailed as e:
+            logger.warning(f"Failed to fetch meaning for {word}: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"Bad dictionary response for {word}: {e}")
+            definition = None
+
+        self.store(word, definition)
+        return definition
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+definition_cache = DefinitionCache()
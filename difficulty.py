@@ -0,0 +1,230 @@
+"""Adaptive word difficulty from measured solve times.
+
+Every word has a rating: the seconds a round with it is expected to take.
+Words nobody has played yet are rated by their length. After each round
+the word's rating moves towards what was observed (hints make a solve
+count as slower, a timeout counts as the full round); it is the mean of
+its rounds, with the length's estimate counted as PRIOR_ROUNDS more. The
+chat's target moves so that its rounds take about the pace of its
+difficulty. A chat that solves a 10s word in 2s gets words rated around
+5x harder.
+
+The difficulty still decides the word length, drawn evenly from its range
+as without adaptation; the target picks among the words of that length.
+Rated words are kept in buckets of similar rating per word length, so
+picking a word near a target is a few list lookups. Unrated words stay in
+the word bank and are drawn from it by length; all of it is O(1) per round
+however large the group.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+
+from wordbank import LENGTH_RANGES, MIN_LENGTH, MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_DIFFICULTY = os.getenv('ADAPTIVE_DIFFICULTY', '1') == '1'
+# Seconds a round should take at each difficulty
+PACE = {"easy": 8.0, "medium": 15.0, "hard": 25.0}
+# Expected seconds of an unrated word: PRIOR_SECONDS at 4 letters, growing
+# by PRIOR_GROWTH with every extra letter
+PRIOR_SECONDS = 5.0
+PRIOR_GROWTH = 1.3
+# Rounds the length's estimate counts for in a word's rating
+PRIOR_ROUNDS = 2
+# Weight of the newest observation in a chat's target
+TARGET_ALPHA = 0.3
+# A solve with one hint counts as this much slower, two hints twice that
+HINT_PENALTY = 0.5
+# Ratings are bucketed on a log scale, BUCKET_RATIO apart
+BUCKET_RATIO = 1.25
+BUCKETS = 20
+# Draws from the word bank that may hit a rated word before giving up
+UNRATED_ATTEMPTS = 4
+# Seconds between re-reads of the ratings other shards added to
+RATING_REFRESH_INTERVAL = float(os.getenv('RATING_REFRESH_INTERVAL', '60'))
+# Queued rows of the store that add to the stored totals
+_DELTAS = 'word_ratings_delta'
+
+
+def prior(length):
+    return PRIOR_SECONDS * PRIOR_GROWTH**(length - 4)
+
+
+def bucket_of(seconds):
+    index = int(math.log(max(seconds, 1.0)) / math.log(BUCKET_RATIO))
+    return min(index, BUCKETS - 1)
+
+
+_PRIOR_BUCKETS = {
+    length: bucket_of(prior(length))
+    for length in range(MIN_LENGTH, MAX_LENGTH + 1)
+}
+
+
+class DifficultyModel:
+    """Word ratings, rating buckets and per-chat targets."""
+
+    def __init__(self, bank, store=None):
+        self.bank = bank
+        self.store = store
+        self._ratings = {}  # {word: [total seconds, rounds]}
+        self._buckets = {}  # {(length, bucket): [words]}
+        self._positions = {}  # {word: index in its bucket}
+        self._rated_per_length = {}  # {length: rated words}
+        self._targets = {}  # {chat_id: target rating in seconds}
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def _read(self):
+        """{word: [total seconds, rounds]} stored for words in the bank."""
+        return {
+            word: [seconds, rounds]
+            for word, seconds, rounds in self.store.iter_rows(
+                "SELECT word, total_seconds, rounds FROM word_ratings")
+            if word in self.bank
+        }
+
+    def _replace(self, ratings):
+        # Rounds rated here but not written yet are not in the database
+        for word in self._ratings:
+            queued = self.store.pending(_DELTAS, word)
+            if queued is not None:
+                rated = ratings.setdefault(word, [0.0, 0])
+                rated[0] += queued[1]
+                rated[1] += queued[2]
+        self._ratings = ratings
+        self._buckets.clear()
+        self._positions.clear()
+        self._rated_per_length.clear()
+        for word in ratings:
+            self._place(word)
+
+    def load(self):
+        """Read stored ratings of words that are in the bank."""
+        if self.store is not None:
+            self._replace(self._read())
+        logger.info(f"Loaded {len(self._ratings)} word ratings")
+        return len(self._ratings)
+
+    async def refresh_forever(self, interval=RATING_REFRESH_INTERVAL):
+        """Pick up the rounds other processes rated, e.g. other shards."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._replace(await asyncio.to_thread(self._read))
+            except Exception as e:
+                logger.error(f"Error refreshing word ratings: {e}")
+
+    def rating(self, word):
+        rated = self._ratings.get(word)
+        estimate = prior(len(word))
+        if rated is None:
+            return estimate
+        return (estimate * PRIOR_ROUNDS + rated[0]) / (PRIOR_ROUNDS + rated[1])
+
+    def _place(self, word):
+        length = len(word)
+        words = self._buckets.setdefault(
+            (length, bucket_of(self.rating(word))), [])
+        self._positions[word] = len(words)
+        words.append(word)
+        self._rated_per_length[length] = self._rated_per_length.get(
+            length, 0) + 1
+
+    def _unplace(self, word):
+        length = len(word)
+        words = self._buckets[(length, bucket_of(self.rating(word)))]
+        # Swap with the last word so removal is O(1)
+        index = self._positions.pop(word)
+        last = words.pop()
+        if last != word:
+            words[index] = last
+            self._positions[last] = index
+        self._rated_per_length[length] -= 1
+
+    def rate(self, word, seconds):
+        """Add one observed round time to a word's rating."""
+        rated = self._ratings.get(word)
+        if rated is None:
+            rated = self._ratings[word] = [0.0, 0]
+        else:
+            self._unplace(word)
+        rated[0] += seconds
+        rated[1] += 1
+        self._place(word)
+        if self.store is not None:
+            # Added to the stored totals, so shards do not overwrite
+            # each other's rounds
+            self.store.put(_DELTAS, word, (word, seconds, 1))
+
+    def observe(self, chat_id, difficulty, word, seconds, hints=0,
+                solved=True):
+        """Record a finished round and adjust the chat's target.
+
+        `seconds` of an unsolved round should be the full round time.
+        """
+        if solved:
+            seconds *= 1 + HINT_PENALTY * hints
+        observed = max(seconds, 0.5)
+        expected = self.rating(word)
+        # Words this chat would solve at its pace: the chat is expected /
+        # observed times as fast as the players who rated the word
+        wanted = min(max(PACE[difficulty] * expected / observed, 1.0),
+                     BUCKET_RATIO**BUCKETS)
+        target = self._targets.get(chat_id, PACE[difficulty])
+        self._targets[chat_id] = math.exp(
+            math.log(target) + TARGET_ALPHA *
+            (math.log(wanted) - math.log(target)))
+        self.rate(word, observed)
+
+    def forget(self, chat_id):
+        self._targets.pop(chat_id, None)
+
+    def target(self, chat_id, difficulty):
+        return self._targets.get(chat_id, PACE[difficulty])
+
+    def pick(self, difficulty, chat_id=None, rng=random):
+        """A word of the difficulty's lengths rated near the chat's target."""
+        min_len, max_len = LENGTH_RANGES[difficulty]
+        lengths = [
+            length for length in range(min_len, max_len + 1)
+            if self.bank.count(length)
+        ]
+        if not lengths:
+            return None
+        length = rng.choice(lengths)
+        wanted = bucket_of(self.target(chat_id, difficulty))
+        # The target bucket first, then its neighbours, nearest first
+        for distance in range(BUCKETS):
+            for index in dict.fromkeys(
+                (wanted - distance, wanted + distance)):
+                if 0 <= index < BUCKETS:
+                    word = self._pick_from(index, length, rng)
+                    if word is not None:
+                        return word
+        return None
+
+    def _pick_from(self, index, length, rng):
+        # Candidates: rated words in the bucket, plus the unrated words of
+        # the length if its prior falls into it
+        rated = self._buckets.get((length, index))
+        size = len(rated) if rated else 0
+        unrated = 0
+        if _PRIOR_BUCKETS[length] == index:
+            unrated = (self.bank.count(length) -
+                       self._rated_per_length.get(length, 0))
+        if size + unrated <= 0:
+            return None
+        choice = rng.randrange(size + unrated)
+        if choice < size:
+            return rated[choice]
+        for _ in range(UNRATED_ATTEMPTS):
+            word = self.bank.word_of_length(length, rng)
+            if word not in self._ratings:
+                return word
+        return None
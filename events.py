@@ -0,0 +1,288 @@
+"""Append-only log of game events and a streaming aggregator over it.
+
+Rounds, wrong guesses, hints, solves and timeouts are appended as compact
+binary records, buffered in memory and written in batches of whole
+records. Each batch is one O_APPEND write, so shard processes can share a
+file. The aggregator reads a log in chunks and keeps only per-word and
+per-user counters, so memory does not grow with the log:
+
+    python -m events report [anagram_events.log ...] [--top 20] [--json]
+
+Record layout, little endian: marker u8 (0xAE), kind u8, unix time f64,
+chat id i64, user id i64 (0 when none), seconds f32, word length u8, word
+(UTF-8).
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from collections import Counter, namedtuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Empty disables the log
+EVENT_LOG = os.getenv('EVENT_LOG', 'anagram_events.log')
+EVENT_BUFFER = int(os.getenv('EVENT_BUFFER', str(64 * 1024)))
+# Buffered events are written at least this often while the bot is busy
+EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', '5'))
+
+ROUND, GUESS, HINT, SOLVE, TIMEOUT = range(1, 6)
+
+_MARKER = 0xAE
+_RECORD = struct.Struct('<BBdqqfB')
+# Solve times are binned to a quarter second for the medians
+_BINS_PER_SECOND = 4
+
+Event = namedtuple("Event", "kind time chat_id user_id seconds word")
+
+written_events = registry.counter("anagram_events_written_total",
+                                  "Game events appended to the event log.")
+
+
+class EventLog:
+    """Buffered appender of event records."""
+
+    def __init__(self,
+                 path=EVENT_LOG,
+                 buffer_size=EVENT_BUFFER,
+                 flush_interval=EVENT_FLUSH_INTERVAL):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = bytearray()
+        self._fd = None
+        self._flushed = time.monotonic()
+
+    def record(self, kind, chat_id, word, user_id=None, seconds=0.0):
+        if not self.path:
+            return
+        encoded = word.encode('utf-8')[:255]
+        self._buffer += _RECORD.pack(_MARKER, kind, time.time(), chat_id,
+                                     user_id or 0, seconds, len(encoded))
+        self._buffer += encoded
+        written_events.inc()
+        if (len(self._buffer) >= self.buffer_size or
+                time.monotonic() - self._flushed >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._flushed = time.monotonic()
+        if not self._buffer:
+            return
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path,
+                                   os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                   0o644)
+            os.write(self._fd, self._buffer)
+        except OSError as e:
+            logger.error(f"Error writing event log {self.path}: {e}")
+        # Dropped on failure rather than growing without bound
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_events(path, chunk_size=1 << 16):
+    """Yield the Events of a log file, reading it a chunk at a time."""
+    with open(path, 'rb') as f:
+        data = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data += chunk
+            offset = 0
+            while offset + _RECORD.size <= len(data):
+                (marker, kind, when, chat_id, user_id, seconds,
+                 length) = _RECORD.unpack_from(data, offset)
+                if marker != _MARKER:
+                    raise ValueError(f"{path} is corrupt at a record "
+                                     f"starting {offset} bytes into a chunk")
+                end = offset + _RECORD.size + length
+                if end > len(data):
+                    break
+                word = data[offset + _RECORD.size:end].decode('utf-8',
+                                                              'replace')
+                yield Event(kind, when, chat_id, user_id, seconds, word)
+                offset = end
+            data = data[offset:]
+    if data:
+        logger.warning(f"Ignoring a truncated record at the end of {path}")
+
+
+def median(bins):
+    """Median seconds of a Counter of quarter-second bins, or None."""
+    total = sum(bins.values())
+    if not total:
+        return None
+    seen = 0
+    for index in sorted(bins):
+        seen += bins[index]
+        if seen * 2 >= total:
+            return (index + 0.5) / _BINS_PER_SECOND
+    return None
+
+
+class WordStats:
+    __slots__ = ("rounds", "solves", "timeouts", "hints", "wrong",
+                 "solve_times")
+
+    def __init__(self):
+        self.rounds = self.solves = self.timeouts = 0
+        self.hints = self.wrong = 0
+        self.solve_times = Counter()  # {quarter second bin: solves}
+
+    def summary(self):
+        return {
+            'rounds': self.rounds,
+            'solve_rate': self.solves / self.rounds if self.rounds else None,
+            'median_solve_seconds': median(self.solve_times),
+            'hints_per_round':
+            self.hints / self.rounds if self.rounds else None,
+            'wrong_guesses': self.wrong,
+        }
+
+
+class UserStats:
+    __slots__ = ("solves", "wrong", "hints")
+
+    def __init__(self):
+        self.solves = self.wrong = self.hints = 0
+
+    def summary(self):
+        guesses = self.solves + self.wrong
+        return {
+            'solves': self.solves,
+            'guesses': guesses,
+            'accuracy': self.solves / guesses if guesses else None,
+            'hints': self.hints,
+        }
+
+
+class Aggregate:
+    """Per-word and per-user statistics folded in one event at a time."""
+
+    def __init__(self):
+        self.words = {}  # {word: WordStats}
+        self.users = {}  # {user_id: UserStats}
+        self.solve_times = Counter()
+        self.events = 0
+
+    def add(self, event):
+        self.events += 1
+        word = self.words.get(event.word)
+        if word is None:
+            word = self.words[event.word] = WordStats()
+        user = None
+        if event.user_id:
+            user = self.users.get(event.user_id)
+            if user is None:
+                user = self.users[event.user_id] = UserStats()
+        if event.kind == ROUND:
+            word.rounds += 1
+        elif event.kind == SOLVE:
+            word.solves += 1
+            timing = int(event.seconds * _BINS_PER_SECOND)
+            word.solve_times[timing] += 1
+            self.solve_times[timing] += 1
+            if user is not None:
+                user.solves += 1
+        elif event.kind == GUESS:
+            word.wrong += 1
+            if user is not None:
+                user.wrong += 1
+        elif event.kind == HINT:
+            word.hints += 1
+            if user is not None:
+                user.hints += 1
+        elif event.kind == TIMEOUT:
+            word.timeouts += 1
+
+    def hardest_words(self, limit, min_rounds=3):
+        """Words seen in at least `min_rounds` rounds, least solved first.
+
+        Words with no round in the log (it started mid-round) come last.
+        """
+        played = [(word, stats.summary())
+                  for word, stats in self.words.items()
+                  if stats.rounds >= min_rounds]
+        played.sort(key=lambda item: (item[1]['solve_rate'] is None, item[1][
+            'solve_rate'] or 0, -(item[1]['median_solve_seconds'] or 0)))
+        return played[:limit]
+
+    def report(self, limit=20, min_rounds=3):
+        return {
+            'events': self.events,
+            'median_solve_seconds': median(self.solve_times),
+            'hardest_words': self.hardest_words(limit, min_rounds),
+            'most_accurate_users': sorted(
+                ((user_id, stats.summary())
+                 for user_id, stats in self.users.items()
+                 if stats.solves + stats.wrong >= min_rounds),
+                # Users who only took hints have no accuracy
+                key=lambda item: (item[1]['accuracy'] is None,
+                                  -(item[1]['accuracy'] or 0)))[:limit],
+        }
+
+
+def aggregate(paths):
+    result = Aggregate()
+    for path in paths:
+        for event in read_events(path):
+            result.add(event)
+    return result
+
+
+def _number(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def _print_report(report):
+    print(f"{report['events']} events, median solve time "
+          f"{report['median_solve_seconds']}s\n")
+    print(f"{'word':<16}{'rounds':>8}{'solved':>8}{'median s':>10}"
+          f"{'hints':>8}")
+    for word, stats in report['hardest_words']:
+        print(f"{word:<16}{stats['rounds']:>8}"
+              f"{_number(stats['solve_rate'], '.0%'):>8}"
+              f"{_number(stats['median_solve_seconds'], '.2f'):>10}"
+              f"{_number(stats['hints_per_round'], '.2f'):>8}")
+    print(f"\n{'user':<16}{'guesses':>8}{'accuracy':>10}")
+    for user_id, stats in report['most_accurate_users']:
+        print(f"{user_id:<16}{stats['guesses']:>8}"
+              f"{_number(stats['accuracy'], '.0%'):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m events")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("paths", nargs="*", default=[EVENT_LOG])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--min-rounds", type=int, default=3,
+                        help="ignore words and users seen less often")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args(argv)
+    report = aggregate(args.paths).report(args.top, args.min_rounds)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        _print_report(report)
+
+
+event_log = EventLog()
+
+
+if __name__ == "__main__":
+    main()
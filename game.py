@@ -0,0 +1,84 @@
+"""Per-chat game state."""
+import sys
+import time
+
+from anagrams import signature
+
+
+class GameState:
+    """One running game. Everything it tracks is bounded by its players.
+
+    `hints` maps user ids to how many hints they took in the current round
+    and is cleared by `start_round`, so it goes away with the game.
+    `deadline` is the scheduler timer that times the current round out.
+    `played` says whether anyone guessed or asked for a hint since the
+    current round started.
+    """
+
+    __slots__ = ("players", "round", "max_rounds", "difficulty", "is_solo",
+                 "solo_player", "solved_counts", "longest_word",
+                 "current_word", "signature", "scrambled", "prepared",
+                 "start_time",
+                 "hints", "hint_cooldowns", "deadline", "missed_rounds",
+                 "played")
+
+    def __init__(self, max_rounds, difficulty, is_solo=False,
+                 solo_player=None):
+        self.players = {}  # {user_id: points this game}
+        self.round = 1
+        self.max_rounds = max_rounds
+        self.difficulty = difficulty
+        self.is_solo = is_solo
+        self.solo_player = solo_player
+        self.solved_counts = {}  # {user_id: rounds solved}
+        self.longest_word = None
+        self.current_word = None
+        self.signature = None  # sorted letters of current_word
+        self.scrambled = None
+        self.prepared = None
+        self.start_time = 0.0
+        self.hints = {}  # {user_id: hint_level} for the current round
+        self.hint_cooldowns = set()  # users waiting for their next hint
+        self.deadline = None
+        self.missed_rounds = 0  # consecutive rounds nobody played
+        self.played = False
+
+    def touch(self):
+        """Note that somebody played the current round."""
+        self.played = True
+
+    def start_round(self, prepared):
+        """Make a PreparedRound the current one."""
+        self.current_word = prepared.word
+        self.signature = signature(prepared.word)
+        self.scrambled = prepared.scrambled
+        self.prepared = prepared
+        self.start_time = time.time()
+        self.hints.clear()
+        if self.longest_word is None or len(prepared.word) > len(
+                self.longest_word):
+            self.longest_word = prepared.word
+        self.played = False
+
+    def record_solve(self, user_id, score):
+        """Credit the current round to user_id."""
+        self.players[user_id] = self.players.get(user_id, 0) + score
+        self.solved_counts[user_id] = self.solved_counts.get(user_id, 0) + 1
+        self.missed_rounds = 0
+        self.touch()
+
+    def cancel_deadline(self):
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+
+    def memory_size(self):
+        """Approximate bytes held by this game, for monitoring."""
+        size = sys.getsizeof(self)
+        for container in (self.players, self.solved_counts, self.hints,
+                          self.hint_cooldowns):
+            size += sys.getsizeof(container)
+        for word in (self.current_word, self.scrambled, self.longest_word):
+            if word is not None:
+                size += sys.getsizeof(word)
+        return size
@@ -0,0 +1,209 @@
+"""Shared non-blocking HTTP client for the word and dictionary APIs.
+
+Connections are pooled and kept alive. Every endpoint (host and port) has
+its health tracked: requests time out after a few times its usual latency
+instead of a fixed DEFAULT_TIMEOUT, and after FAILURE_THRESHOLD failures
+in a row its circuit opens, so callers fail fast with CircuitOpen until a
+single probe request gets through again.
+"""
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from telegram.request import HTTPXRequest
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv('HTTP_MAX_CONCURRENCY', '20'))
+DEFAULT_TIMEOUT = 3.0  # Also the ceiling for adaptive timeouts
+MIN_TIMEOUT = 0.5
+FAILURE_THRESHOLD = int(os.getenv('HTTP_FAILURE_THRESHOLD', '5'))
+OPEN_SECONDS = float(os.getenv('HTTP_CIRCUIT_OPEN_SECONDS', '30'))
+MAX_OPEN_SECONDS = 600.0
+
+requests_total = registry.counter(
+    "anagram_http_requests_total",
+    "Outbound HTTP requests by endpoint and status.",
+    ("endpoint", "status"))
+request_seconds = registry.histogram(
+    "anagram_http_request_seconds",
+    "Outbound HTTP request latency by endpoint.", ("endpoint", ))
+
+
+def _observe(endpoint, status, started):
+    requests_total.inc(endpoint, status)
+    request_seconds.observe(time.perf_counter() - started, endpoint)
+
+
+class CircuitOpen(Exception):
+    """The endpoint failed repeatedly and is skipped for now."""
+
+
+class EndpointHealth:
+    """Latency estimate and circuit breaker state of one endpoint.
+
+    The timeout follows TCP's retransmission timer: smoothed latency plus
+    four times its mean deviation, kept within [MIN_TIMEOUT, ceiling].
+    """
+
+    __slots__ = ("latency", "deviation", "failures", "open_until",
+                 "open_for", "probing")
+
+    def __init__(self):
+        self.latency = None
+        self.deviation = 0.0
+        self.failures = 0  # in a row
+        self.open_until = None  # set while the circuit is open
+        self.open_for = OPEN_SECONDS
+        self.probing = False
+
+    @property
+    def is_open(self):
+        return self.open_until is not None
+
+    def timeout(self, ceiling):
+        if self.latency is None:
+            return ceiling
+        return min(ceiling,
+                   max(MIN_TIMEOUT, self.latency + 4 * self.deviation))
+
+    def allow(self, now):
+        """Whether a request may go out; half-open lets one probe through."""
+        if self.open_until is None:
+            return True
+        if now < self.open_until or self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def succeeded(self, seconds):
+        if self.latency is None:
+            self.latency, self.deviation = seconds, seconds / 2
+        else:
+            self.deviation += (abs(seconds - self.latency) -
+                               self.deviation) / 4
+            self.latency += (seconds - self.latency) / 8
+        self.failures = 0
+        self.open_until = None
+        self.open_for = OPEN_SECONDS
+        self.probing = False
+
+    def failed(self, now, timed_out=False):
+        """Record a failure, returns True if this opened the circuit."""
+        self.failures += 1
+        if timed_out:
+            # Start over from the full timeout until it answers again
+            self.latency = None
+        if self.probing:
+            # The probe failed, stay open for twice as long
+            self.probing = False
+            self.open_for = min(self.open_for * 2, MAX_OPEN_SECONDS)
+            self.open_until = now + self.open_for
+            return False
+        if self.open_until is None and self.failures >= FAILURE_THRESHOLD:
+            self.open_until = now + self.open_for
+            return True
+        return False
+
+
+class HttpClient:
+    """One pooled httpx.AsyncClient with a cap on requests in flight."""
+
+    def __init__(self,
+                 max_concurrency=MAX_CONCURRENT_REQUESTS,
+                 timeout=DEFAULT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.health = {}  # {"host:port": EndpointHealth}
+        self._client = None
+        self._semaphore = None
+
+    def _get_client(self):
+        # Created lazily so both live on the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def get(self, url, **kwargs):
+        client = self._get_client()
+        endpoint = urlsplit(url).netloc or "unknown"
+        health = self.health.get(endpoint)
+        if health is None:
+            health = self.health[endpoint] = EndpointHealth()
+        if not health.allow(time.monotonic()):
+            requests_total.inc(endpoint, "circuit_open")
+            raise CircuitOpen(f"{endpoint} is failing, skipped")
+        kwargs.setdefault('timeout', health.timeout(self.timeout))
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, **kwargs)
+            except asyncio.CancelledError:
+                health.probing = False  # Let another request probe
+                raise
+            except Exception as e:
+                _observe(endpoint, type(e).__name__, started)
+                self._failed(endpoint, health,
+                             isinstance(e, httpx.TimeoutException))
+                raise
+            _observe(endpoint, str(response.status_code), started)
+            if response.status_code >= 500 or response.status_code == 429:
+                self._failed(endpoint, health)
+            else:
+                health.succeeded(time.perf_counter() - started)
+            return response
+
+    @staticmethod
+    def _failed(endpoint, health, timed_out=False):
+        if health.failed(time.monotonic(), timed_out):
+            logger.warning(f"Circuit opened for {endpoint} after "
+                           f"{health.failures} failures")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest for the Bot API that records every call by method."""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        endpoint = "telegram." + url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method,
+                                                     request_data, **kwargs)
+        except Exception as e:
+            _observe(endpoint, type(e).__name__, started)
+            raise
+        _observe(endpoint, str(code), started)
+        return code, payload
+
+
+http_client = HttpClient()
+registry.collect("anagram_http_circuit_open",
+                 "1 while requests to an endpoint are skipped.",
+                 lambda: {
+                     endpoint: int(health.is_open)
+                     for endpoint, health in list(http_client.health.items())
+                 },
+                 labelnames=("endpoint", ))
+registry.collect("anagram_http_timeout_seconds",
+                 "Current adaptive timeout of an endpoint.",
+                 lambda: {
+                     endpoint: health.timeout(http_client.timeout)
+                     for endpoint, health in list(http_client.health.items())
+                 },
+                 labelnames=("endpoint", ))
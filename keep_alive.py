@@ -1,7 +1,13 @@
-from flask import Flask
+from flask import Flask, Response, request
 from threading import Thread
+import hmac
+import os
+
+from metrics import registry
+from webhook import inbox, WEBHOOK_PATH
 
 app = Flask('')
+PORT = int(os.getenv('PORT', '8080'))
 
 
 @app.route('/')
@@ -9,10 +15,35 @@ def home():
     return "Bot is alive!"
 
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def webhook():
+    secret = inbox.secret
+    if secret is None:
+        # Not in webhook mode, nothing would handle the update
+        return "Not Found", 404
+    if not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''),
+            secret):
+        return "Forbidden", 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return "Bad Request", 400
+    # Telegram retries refused updates later, which is our backpressure
+    if not inbox.offer(data):
+        return "Busy", 503, {'Retry-After': '1'}
+    return "OK"
+
+
+def run(port=PORT):
+    app.run(host='0.0.0.0', port=port, threaded=True)
 
 
-def keep_alive():
-    t = Thread(target=run)
+def keep_alive(port=PORT):
+    t = Thread(target=run, args=(port, ), daemon=True)
     t.start()
@@ -0,0 +1,39 @@
+"""Per-chat locks around game state changes that span awaits.
+
+Updates of one chat are handled concurrently and round timers fire on
+their own, so every transition of a game (start it, score a round and move
+on, time a round out) holds its chat's lock. Chat ids map onto a fixed
+number of stripes, so there is nothing to create or clean up per chat and
+two busy chats rarely wait for each other.
+"""
+import asyncio
+import os
+
+from metrics import registry
+
+CHAT_LOCK_STRIPES = int(os.getenv('CHAT_LOCK_STRIPES', '1024'))
+
+lock_waits = registry.counter(
+    "anagram_chat_lock_waits_total",
+    "Game state changes that had to wait for another one on their stripe.")
+
+
+class ChatLocks:
+    """`async with chat_locks(chat_id):` serializes work on one chat."""
+
+    def __init__(self, stripes=CHAT_LOCK_STRIPES):
+        self.stripes = stripes
+        # Created on first use, so they belong to the running event loop
+        self._locks = {}  # {stripe: asyncio.Lock}
+
+    def __call__(self, chat_id):
+        stripe = chat_id % self.stripes
+        lock = self._locks.get(stripe)
+        if lock is None:
+            lock = self._locks[stripe] = asyncio.Lock()
+        elif lock.locked():
+            lock_waits.inc()
+        return lock
+
+
+chat_locks = ChatLocks()
@@ -1,17 +1,36 @@
-from keep_alive import keep_alive
+import time
 
-#keep_alive()
+# Startup phases are timed from here, before the heavy imports below
+STARTED = time.perf_counter()
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (Updater, CommandHandler, MessageHandler,
-                          CallbackContext, CallbackQueryHandler, Filters,
-                          PicklePersistence)
+from telegram import Update
+from telegram.ext import (Application, CommandHandler, MessageHandler,
+                          ContextTypes, CallbackQueryHandler, filters)
+import asyncio
+import functools
 import random
-import time
-import requests
-from collections import defaultdict
 import os
+import secrets
 import logging
+from wordbank import word_bank, LENGTH_RANGES, WORDS_FILE
+from difficulty import DifficultyModel, ADAPTIVE_DIFFICULTY
+from anagrams import anagram_index, signature
+from definitions import definition_cache
+from events import event_log, ROUND, GUESS, HINT, SOLVE, TIMEOUT
+from prefetch import RoundPrefetcher
+from game import GameState
+from scheduler import timers
+from http_client import http_client, InstrumentedRequest
+from locks import chat_locks
+from metrics import registry
+from names import name_cache
+from outbox import outbox, LOW
+from storage import (storage, stats_store, SQLitePersistence,
+                     import_legacy_pickle, SHARDS, TOP_SIZE)
+import messages
+from sharding import run_sharded
+from matching import match, wanted, RoundCandidate, CORRECT, WRONG_ANAGRAM
+from webhook import inbox, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
 
 # Enable logging
 logging.basicConfig(
@@ -19,126 +38,234 @@ logging.basicConfig(
     level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
-# Dictionary API function
-def get_random_word(difficulty="medium"):
-    """Fetches random dictionary words"""
-    # Word length ranges by difficulty
-    length_ranges = {"easy": (4, 6), "medium": (6, 9), "hard": (8, 12)}
-    min_len, max_len = length_ranges[difficulty]
-    target_length = random.randint(min_len, max_len)
-
-    # Try multiple API endpoints
-    api_endpoints = [
-        f"https://random-word-api.herokuapp.com/word?length={target_length}",
-        f"https://random-word-api.vercel.app/api?length={target_length}",
-    ]
-
-    for endpoint in api_endpoints:
-        try:
-            response = requests.get(endpoint, timeout=3)
-            if response.status_code == 200:
-                words = response.json()
-                if isinstance(words, list) and words:
-                    word = random.choice(words)
-                    if word.isalpha() and min_len <= len(word) <= max_len:
-                        return word.lower()
-        except Exception as e:
-            logger.warning(f"Failed to fetch word from {endpoint}: {e}")
-            continue
+handler_seconds = registry.histogram("anagram_handler_seconds",
+                                     "Time spent in each update handler.",
+                                     ("handler", ))
+guesses = registry.counter("anagram_guesses_total",
+                           "Messages checked against a round, by result.",
+                           ("result", ))
+word_fallbacks = registry.counter(
+    "anagram_word_fallbacks_total",
+    "Words generated because the word bank had none.", ("difficulty", ))
+
+# Seconds from process start until updates are handled before we warn
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', '5'))
+startup_phases = {}  # {phase: seconds}
+_last_mark = STARTED
+registry.collect("anagram_startup_seconds",
+                 "Time spent in each startup phase.",
+                 lambda: startup_phases,
+                 labelnames=("phase", ))
+
+
+def startup_mark(phase):
+    """Record that `phase` just ended; it took the time since the last mark."""
+    global _last_mark
+    now = time.perf_counter()
+    startup_phases[phase] = now - _last_mark
+    _last_mark = now
+    logger.info(f"Startup: {phase} took {startup_phases[phase] * 1000:.0f} ms")
+
+
+# With a seed, every game draws its words and scrambles from its own RNG,
+# seeded by the chat and how many games it started, so a recorded session
+# replays with the same rounds. Unset, games are seeded from the OS.
+RANDOM_SEED = os.getenv('RANDOM_SEED')
+_games_started = {}  # {chat_id: games started, only counted with a seed}
+
+
+def game_rng(chat_id):
+    """A new RNG for a game starting in chat_id."""
+    if RANDOM_SEED is None:
+        return random.Random()
+    count = _games_started.get(chat_id, 0)
+    _games_started[chat_id] = count + 1
+    return random.Random(f"{RANDOM_SEED}:{chat_id}:{count}")
+
+
+# Word selection
+def get_random_word(difficulty="medium", chat_id=None, rng=random):
+    """Picks a word from the local word bank, rated near the chat's target"""
+    if ADAPTIVE_DIFFICULTY:
+        word = difficulty_model.pick(difficulty, chat_id, rng)
+    else:
+        word = word_bank.random_word(difficulty, rng)
+    if word:
+        return word
 
     # Fallback word generation
+    logger.warning(f"Word bank has no {difficulty} words, generating one")
+    word_fallbacks.inc(difficulty)
+    min_len, max_len = LENGTH_RANGES[difficulty]
+    target_length = rng.randint(min_len, max_len)
     vowels = 'aeiou'
     consonants = 'bcdfghjklmnpqrstvwxyz'
     word = ''.join(
-        random.choice(consonants if i % 2 == 0 else vowels)
+        rng.choice(consonants if i % 2 == 0 else vowels)
         for i in range(target_length))
     return word
 
 
-def get_word_meaning(word):
-    """Fetches word meaning from Free Dictionary API"""
-    try:
-        response = requests.get(
-            f"https://api.dictionaryapi.dev/api/v2/entries/en/{word}",
-            timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            if isinstance(data, list) and len(data) > 0:
-                meanings = data[0].get("meanings", [])
-                if meanings:
-                    definitions = meanings[0].get("definitions", [])
-                    if definitions:
-                        return definitions[0].get("definition",
-                                                  "No definition found")
-    except Exception as e:
-        logger.warning(f"Failed to fetch meaning for {word}: {e}")
-    return "No definition available"
+async def get_word_meaning(word):
+    """Returns the word meaning, served from the definition cache when known"""
+    return await definition_cache.get(word)
 
 
-# Initialize persistence for saving data
-persistence = PicklePersistence(filename='anagram_bot_data')
-active_games = {}
-hint_progress = defaultdict(dict)  # {chat_id: {user_id: hint_level}}
+SCRAMBLE_ATTEMPTS = 20
+
+
+def scramble_word(word, rng=random):
+    """Shuffles the letters of a word, avoiding scrambles that are words"""
+    # A scramble that is itself a valid answer gives the round away
+    taken = anagram_index.words(signature(word)) or (word, )
+    for _ in range(SCRAMBLE_ATTEMPTS):
+        scrambled = ''.join(rng.sample(word, len(word)))
+        if scrambled not in taken:
+            return scrambled
+    return scrambled
+
+
+def load_words():
+    """Load the word bank and the anagram index built from it."""
+    word_bank.load()
+    anagram_index.load(word_bank, words_file=WORDS_FILE)
+    word_bank.on_add = anagram_index.add
+    difficulty_model.load()
 
 
-def start(update: Update, context: CallbackContext):
+# Initialize persistence for saving data
+persistence = SQLitePersistence(storage)
+difficulty_model = DifficultyModel(word_bank, storage)
+leaderboard_cache = messages.LeaderboardCache(stats_store, TOP_SIZE)
+active_games = {}  # {chat_id: GameState}
+
+# Unsolved rounds are revealed and skipped after ROUND_TIMEOUT seconds, and
+# a game ends once MAX_MISSED_ROUNDS rounds in a row saw no guesses at all
+ROUND_TIMEOUT = float(os.getenv('ROUND_TIMEOUT', '60'))
+MAX_MISSED_ROUNDS = int(os.getenv('MAX_MISSED_ROUNDS', '3'))
+HINT_COOLDOWN = float(os.getenv('HINT_COOLDOWN', '5'))
+MEANING_DELAY = 0.5
+
+# Updates handled at once; each game's state changes happen between awaits
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '256'))
+# Connections to the Bot API; PTB's default of one serializes every call
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '64'))
+background_tasks = set()
+
+# Upcoming rounds are prepared in the background for every active game
+prefetcher = RoundPrefetcher(get_random_word,
+                             scramble_word,
+                             get_word_meaning,
+                             depth=int(os.getenv('PREFETCH_DEPTH', '3')))
+
+
+def cache_lookups():
+    return {
+        ("definitions", "hit"): definition_cache.hits,
+        ("definitions", "miss"): definition_cache.misses,
+        ("names", "hit"): name_cache.hits,
+        ("names", "miss"): name_cache.misses,
+    }
+
+
+def cache_hit_ratios():
+    ratios = {}
+    for cache in (definition_cache, name_cache):
+        total = cache.hits + cache.misses
+        name = "definitions" if cache is definition_cache else "names"
+        ratios[name] = cache.hits / total if total else 0.0
+    return ratios
+
+
+registry.collect("anagram_cache_lookups_total",
+                 "Cache lookups by cache and result.",
+                 cache_lookups,
+                 kind="counter",
+                 labelnames=("cache", "result"))
+registry.collect("anagram_cache_hit_ratio",
+                 "Share of cache lookups served without a fetch.",
+                 cache_hit_ratios,
+                 labelnames=("cache", ))
+registry.collect("anagram_active_games", "Games in progress.",
+                 lambda: len(active_games))
+registry.collect("anagram_prefetch_queued_rounds",
+                 "Prepared rounds waiting across all games.",
+                 prefetcher.queued)
+registry.collect("anagram_prefetch_empty_takes_total",
+                 "Rounds prepared inline because the queue was empty.",
+                 lambda: prefetcher.empty_takes,
+                 kind="counter")
+registry.collect("anagram_pending_timers",
+                 "Round deadlines and delayed messages scheduled.",
+                 lambda: len(timers))
+registry.collect("anagram_outbox_queued", "Messages waiting to be sent.",
+                 lambda: len(outbox))
+registry.collect("anagram_storage_pending_rows",
+                 "Rows queued for the next storage flush.",
+                 storage.pending_rows)
+
+
+def timed_handler(callback):
+    """Record the latency of an update handler under its name."""
+
+    @functools.wraps(callback)
+    async def timed(update, context):
+        with handler_seconds.time(callback.__name__):
+            return await callback(update, context)
+
+    return timed
+
+
+def chat_serialized(callback):
+    """Run a handler that changes game state under its chat's lock."""
+
+    @functools.wraps(callback)
+    async def serialized(update, context):
+        chat = update.effective_chat
+        if chat is None:
+            return await callback(update, context)
+        async with chat_locks(chat.id):
+            return await callback(update, context)
+
+    return serialized
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message."""
     try:
         user = update.effective_user
-        welcome_message = (
-            f"🌟 Welcome {user.first_name} to Anagram Challenge! 🌟\n\n"
-            "🧠 Test your word skills by unscrambling letters!\n\n"
-            "📌 Available Commands:\n"
-            "/help - How to play\n"
-            "/newgame - Start a new game in groups\n"
-            "/newplay - Play solo in private chat\n"
-            "/leaderboard - Top players of all time\n"
-            "/stats - Your personal statistics\n\n"
-            "🏆 Compete with friends and climb the leaderboard!")
-        update.message.reply_text(welcome_message)
+        welcome_message = messages.welcome(user.first_name)
+        await update.message.reply_text(welcome_message)
     except Exception as e:
         logger.error(f"Error in start command: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def help_command(update: Update, context: CallbackContext):
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help instructions."""
     try:
-        help_text = (
-            "📖 How to Play Anagram Challenge:\n\n"
-            "1. Start a game with /newgame (in groups) or /newplay (in private)\n"
-            "2. You'll see scrambled letters of a word\n"
-            "3. Type the correct word to earn points\n"
-            "4. Faster answers earn more points!\n\n"
-            "💡 Tips:\n"
-            "- Use /hint to get help with the current word\n"
-            "- Check /leaderboard to see top players\n"
-            "- Your points accumulate across all games!")
-        update.message.reply_text(help_text)
+        await update.message.reply_text(messages.HELP)
     except Exception as e:
         logger.error(f"Error in help command: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def stats(update: Update, context: CallbackContext):
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's personal statistics."""
     try:
         user_id = update.effective_user.id
 
-        # Get global stats from bot_data
-        total_points = context.bot_data.get('global_stats',
-                                            {}).get(user_id,
-                                                    {}).get('points', 0)
-        games_played = context.bot_data.get('global_stats',
-                                            {}).get(user_id,
-                                                    {}).get('games_played', 0)
+        # Get global stats from the stats store
+        user_stats = stats_store.get(user_id) or {}
+        total_points = user_stats.get('points', 0)
+        games_played = user_stats.get('games_played', 0)
 
         # Get current game stats if available
         current_game_points = 0
         for chat_id, game in active_games.items():
-            if user_id in game.get('players', {}):
-                current_game_points += game['players'][user_id]
+            current_game_points += game.players.get(user_id, 0)
 
         stats_text = (f"📊 Your Statistics 📊\n\n"
                       f"🏆 Total Points: {total_points + current_game_points}\n"
@@ -146,155 +273,113 @@ def stats(update: Update, context: CallbackContext):
                       f"🔥 Current Game Points: {current_game_points}\n\n"
                       "Keep playing to climb the leaderboard! 🚀")
 
-        update.message.reply_text(stats_text)
+        await update.message.reply_text(stats_text)
     except Exception as e:
         logger.error(f"Error in stats command: {e}")
-        update.message.reply_text(
+        await update.message.reply_text(
             "An error occurred while fetching your stats.")
 
 
-def update_global_stats(user_id: int, points: int, context: CallbackContext):
+def update_global_stats(user_id: int, points: int, name: str):
     """Update the global statistics for a user."""
     try:
-        if 'global_stats' not in context.bot_data:
-            context.bot_data['global_stats'] = {}
-
-        user_stats = context.bot_data['global_stats'].setdefault(
-            user_id, {
-                'points': 0,
-                'games_played': 0,
-                'name': context.bot.get_chat(user_id).first_name
-            })
-
-        user_stats['points'] += points
-        user_stats['games_played'] += 1
-
-        # Explicitly save the persistence
-        if hasattr(context.bot, 'persistence'):
-            context.bot.persistence.flush()
+        # Only this user's row is written, batched with other changes
+        stats_store.record_game(user_id, points, name)
 
     except Exception as e:
         logger.error(f"Error updating global stats: {e}")
 
 
-def leaderboard(update: Update, context: CallbackContext):
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show all-time leaderboard."""
     try:
-        if 'global_stats' not in context.bot_data or not context.bot_data[
-                'global_stats']:
-            update.message.reply_text(
-                "No leaderboard data yet. Be the first to play!")
+        # The top players' board is only rendered again after it changed
+        leaderboard_text = leaderboard_cache.text()
+        if leaderboard_text is None:
+            await update.message.reply_text(messages.NO_LEADERBOARD)
             return
 
-        # Get top 10 players
-        all_players = context.bot_data['global_stats'].items()
-        sorted_players = sorted(all_players,
-                                key=lambda x: x[1]['points'],
-                                reverse=True)[:10]
-
-        leaderboard_text = "🏆 All-Time Leaderboard 🏆\n\n"
-        for i, (user_id, stats) in enumerate(sorted_players, 1):
-            leaderboard_text += f"{i}. {stats['name']}: {stats['points']} points\n"
-
         # Add current user's position if not in top 10
         current_user_id = update.effective_user.id
-        if current_user_id in context.bot_data['global_stats']:
-            user_points = context.bot_data['global_stats'][current_user_id][
-                'points']
-            user_position = next((i + 1
-                                  for i, (uid, _) in enumerate(sorted_players)
-                                  if uid == current_user_id),
-                                 len(sorted_players) + 1)
-            if user_position > 10:
+        user_position = stats_store.rank(current_user_id)
+        if user_position is not None:
+            user_points = stats_store.get(current_user_id)['points']
+            if user_position > TOP_SIZE:
                 leaderboard_text += f"\nYour position: {user_position} with {user_points} points"
 
-        update.message.reply_text(leaderboard_text)
+        await update.message.reply_text(leaderboard_text)
     except Exception as e:
         logger.error(f"Error in leaderboard command: {e}")
-        update.message.reply_text(
+        await update.message.reply_text(
             "An error occurred while fetching the leaderboard.")
 
 
-def newgame(update: Update, context: CallbackContext):
+async def newgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start a new game setup (choose difficulty & rounds) in groups."""
     try:
         if update.effective_chat.type == 'private':
-            update.message.reply_text(
+            await update.message.reply_text(
                 "Use /newplay for solo games in private chat!")
             return
 
-        keyboard = [
-            [InlineKeyboardButton("Easy", callback_data="easy")],
-            [InlineKeyboardButton("Medium", callback_data="medium")],
-            [InlineKeyboardButton("Hard", callback_data="hard")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        update.message.reply_text("Choose difficulty:",
-                                  reply_markup=reply_markup)
+        await update.message.reply_text(
+            "Choose difficulty:", reply_markup=messages.DIFFICULTY_KEYBOARD)
     except Exception as e:
         logger.error(f"Error in newgame command: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def newplay(update: Update, context: CallbackContext):
+async def newplay(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start a new solo game in private chat."""
     try:
         if update.effective_chat.type != 'private':
-            update.message.reply_text(
+            await update.message.reply_text(
                 "This is for private chat only! Use /newgame in groups.")
             return
 
-        keyboard = [
-            [InlineKeyboardButton("Easy", callback_data="easy_solo")],
-            [InlineKeyboardButton("Medium", callback_data="medium_solo")],
-            [InlineKeyboardButton("Hard", callback_data="hard_solo")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        update.message.reply_text("Choose difficulty for your solo game:",
-                                  reply_markup=reply_markup)
+        await update.message.reply_text(
+            "Choose difficulty for your solo game:",
+            reply_markup=messages.SOLO_DIFFICULTY_KEYBOARD)
     except Exception as e:
         logger.error(f"Error in newplay command: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def choose_rounds(update: Update, context: CallbackContext):
+async def choose_rounds(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """After selecting difficulty, choose number of rounds."""
     try:
         query = update.callback_query
-        query.answer()
+        await query.answer()
 
         difficulty = query.data.replace('_solo', '')
         context.user_data["difficulty"] = difficulty
         context.user_data["is_solo"] = '_solo' in query.data
 
-        keyboard = [
-            [InlineKeyboardButton("10 Rounds", callback_data="10")],
-            [InlineKeyboardButton("30 Rounds", callback_data="30")],
-            [InlineKeyboardButton("50 Rounds", callback_data="50")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        query.edit_message_text(
+        await query.edit_message_text(
             f"Difficulty: {difficulty.capitalize()}\n\n"
             "Now select the number of rounds:",
-            reply_markup=reply_markup)
+            reply_markup=messages.ROUNDS_KEYBOARD)
     except Exception as e:
         logger.error(f"Error in choose_rounds: {e}")
         if update.callback_query:
-            update.callback_query.message.reply_text(
+            await update.callback_query.message.reply_text(
                 "An error occurred. Please try again.")
 
 
-def start_game(update: Update, context: CallbackContext):
+async def start_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Initialize the game with selected settings."""
     try:
         query = update.callback_query
-        query.answer()
+        await query.answer()
 
         chat_id = query.message.chat_id
         user_id = query.from_user.id
+        name_cache.remember(query.from_user)
 
         if "difficulty" not in context.user_data:
-            query.edit_message_text(
+            await query.edit_message_text(
                 "Please start a new game and select difficulty first! Use /newgame or /newplay"
             )
             return
@@ -303,178 +388,255 @@ def start_game(update: Update, context: CallbackContext):
         difficulty = context.user_data["difficulty"]
         is_solo = context.user_data.get("is_solo", False)
 
+        # A game started over the running one leaves no deadline behind
+        previous = active_games.get(chat_id)
+        if previous is not None:
+            previous.cancel_deadline()
+
         # Initialize game
-        active_games[chat_id] = {
-            "players": {},
-            "round": 1,
-            "max_rounds": rounds,
-            "difficulty": difficulty,
-            "is_solo": is_solo,
-            "solo_player": user_id if is_solo else None,
-            "solved_by": {},  # Track who solved each round
-            "words_used": []  # Track all words used
-        }
-
-        # Reset hint progress for this chat
-        if chat_id in hint_progress:
-            del hint_progress[chat_id]
+        active_games[chat_id] = GameState(
+            rounds,
+            difficulty,
+            is_solo=is_solo,
+            solo_player=user_id if is_solo else None)
+
+        # Prepare the next rounds while the first one is played
+        difficulty_model.forget(chat_id)
+        prefetcher.start(chat_id, difficulty, game_rng(chat_id))
 
         # Start first round
-        next_round(chat_id, context.bot)
+        await next_round(chat_id, context.bot)
     except Exception as e:
         logger.error(f"Error in start_game: {e}")
         if update.callback_query:
-            update.callback_query.message.reply_text(
+            await update.callback_query.message.reply_text(
                 "An error occurred. Please try again.")
 
 
-def next_round(chat_id, bot):
+async def next_round(chat_id, bot):
     """Load a new word for the next round."""
     try:
         game = active_games[chat_id]
 
-        # Get fresh random word from API
-        word = get_random_word(game["difficulty"])
-        scrambled = ''.join(random.sample(word, len(word)))
-
-        game["current_word"] = word
-        game["scrambled"] = scrambled
-        game["start_time"] = time.time()
-        game["words_used"].append(word)  # Track the word used
+        # Take the next prepared round, the prefetcher tops itself up.
+        # This also resets the hints of the previous round.
+        prepared = prefetcher.take(chat_id, game.difficulty)
+        game.start_round(prepared)
+        event_log.record(ROUND, chat_id, game.current_word)
+        game.deadline = timers.call_later(ROUND_TIMEOUT, round_timed_out,
+                                          chat_id, game, game.round, bot)
 
-        # Reset hints for new round
-        if chat_id in hint_progress:
-            hint_progress[chat_id] = {}
+        round_text = messages.round_announcement(game.round, game.max_rounds,
+                                                 prepared.scrambled,
+                                                 game.is_solo)
 
-        round_text = (f"🔤 Round {game['round']}/{game['max_rounds']}\n"
-                      f"Unscramble this word: {scrambled}\n\n")
+        round_number = game.round
 
-        if game.get('is_solo'):
-            round_text += "⏳ Faster answers earn more points!\n💡 Use /hint to get help"
-        else:
-            round_text += "⏳ Fastest correct answer wins points!\n💡 Use /hint to get help"
+        def round_shown(sent):
+            # The clock starts when players can see the word, not when queued
+            if game.round == round_number and game.current_word:
+                game.start_time = time.time()
 
-        bot.send_message(chat_id, round_text)
+        outbox.send(bot, chat_id, round_text).add_done_callback(round_shown)
     except Exception as e:
         logger.error(f"Error in next_round: {e}")
-        bot.send_message(chat_id,
-                         "An error occurred. Please start a new game.")
+        await bot.send_message(chat_id,
+                               "An error occurred. Please start a new game.")
+
+
+async def round_timed_out(chat_id, game, round_number, bot):
+    """Reveal the word of an unsolved round and move on."""
+    async with chat_locks(chat_id):
+        try:
+            # Ignore timers of rounds that were solved or games that ended
+            if (active_games.get(chat_id) is not game
+                    or game.round != round_number or not game.current_word):
+                return
+
+            word = game.current_word
+            game.current_word = None
+            game.deadline = None
+            event_log.record(TIMEOUT, chat_id, word)
+            if not game.played:
+                game.missed_rounds += 1
+            else:
+                game.missed_rounds = 0
+                # Only rounds somebody played say how hard the word was
+                difficulty_model.observe(chat_id, game.difficulty, word,
+                                         ROUND_TIMEOUT, solved=False)
+
+            outbox.send(bot, chat_id, f"⏰ Time's up! The word was: {word}")
+
+            game.round += 1
+            if game.missed_rounds >= MAX_MISSED_ROUNDS:
+                logger.info(f"Ending idle game in chat {chat_id}")
+                outbox.send(bot, chat_id, "⌛ Game ended due to inactivity.")
+                await end_game(chat_id, bot)
+            elif game.round > game.max_rounds:
+                await end_game(chat_id, bot)
+            else:
+                await next_round(chat_id, bot)
+        except Exception as e:
+            logger.error(f"Error timing out round: {e}")
 
 
-def hint(update: Update, context: CallbackContext):
+async def hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Provide progressive hints about the current word."""
     try:
         chat_id = update.effective_chat.id
         user_id = update.effective_user.id
 
         if chat_id not in active_games:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "No active game! Start a new game with /newgame or /newplay")
             return
 
-        word = active_games[chat_id]["current_word"]
+        game = active_games[chat_id]
+        word = game.current_word
+        if not word:
+            await update.message.reply_text(
+                "⏳ The next word is on its way!")
+            return
 
-        # Initialize or update hint progress
-        if chat_id not in hint_progress:
-            hint_progress[chat_id] = {}
-        if user_id not in hint_progress[chat_id]:
-            hint_progress[chat_id][user_id] = 0
+        if user_id in game.hint_cooldowns:
+            await update.message.reply_text(
+                "⏳ Please wait a few seconds before the next hint.")
+            return
 
-        hint_level = hint_progress[chat_id][user_id]
+        # Hint progress lives on the game and is reset every round
+        hint_level = game.hints.get(user_id, 0)
 
         # Calculate how many letters to reveal (progressive)
         reveal_count = min(hint_level + 1, len(word))
         revealed = word[:reveal_count]
         hidden = "_" * (len(word) - reveal_count)
 
-        hint_progress[chat_id][user_id] += 1
-
-        update.message.reply_text(
-            f"💡 Hint ({hint_level+1}/{len(word)}):\n"
-            f"The word starts with: {revealed}{hidden}\n\n"
-            f"Original scrambled: {active_games[chat_id]['scrambled']}")
+        game.hints[user_id] = hint_level + 1
+        event_log.record(HINT, chat_id, word, user_id)
+        game.touch()
+        game.hint_cooldowns.add(user_id)
+        timers.call_later(HINT_COOLDOWN, game.hint_cooldowns.discard, user_id)
+
+        outbox.send(context.bot,
+                    chat_id, f"💡 Hint ({hint_level+1}/{len(word)}):\n"
+                    f"The word starts with: {revealed}{hidden}\n\n"
+                    f"Original scrambled: {game.scrambled}",
+                    reply_to_message_id=update.message.message_id)
     except Exception as e:
         logger.error(f"Error in hint command: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def check_answer(update: Update, context: CallbackContext):
+async def check_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Check if the player's guess is correct."""
     try:
         chat_id = update.effective_chat.id
         user_id = update.effective_user.id
         user_guess = update.message.text.lower()
 
-        if chat_id not in active_games:
-            return  # No active game
+        game = active_games.get(chat_id)
+        if game is None:
+            return  # The game ended since the filter let this through
 
-        game = active_games[chat_id]
-        correct_word = game["current_word"]
+        correct_word = game.current_word
+        result = match(game, user_guess)
 
-        if user_guess == correct_word:
-            time_taken = time.time() - game["start_time"]
+        if result == CORRECT:
+            guesses.inc("correct")
+            # Close the round before the first await, so a second correct
+            # guess handled concurrently cannot score it again
+            game.current_word = None
+            game.cancel_deadline()
+            time_taken = time.time() - game.start_time
             score = max(10 - int(time_taken), 1)  # Faster = More points
 
-            # Update player score
-            if user_id not in game["players"]:
-                game["players"][user_id] = 0
-            game["players"][user_id] += score
+            # Update player score and who solved this round
+            game.record_solve(user_id, score)
+            event_log.record(SOLVE, chat_id, correct_word, user_id,
+                             time_taken)
+            difficulty_model.observe(chat_id,
+                                     game.difficulty,
+                                     correct_word,
+                                     time_taken,
+                                     hints=sum(game.hints.values()))
 
-            # Track who solved this round
-            game["solved_by"][game["round"]] = user_id
+            prepared = game.prepared
 
-            # Get word meaning
-            meaning = get_word_meaning(correct_word)
-
-            # Announce winner
+            # Announce winner, remembering the name for the final scores
+            name_cache.remember(update.effective_user)
             user_name = update.effective_user.first_name
+            # Other dictionary words with the same letters count too
+            if user_guess == correct_word:
+                solved_word = correct_word
+            else:
+                solved_word = f"{user_guess} (or {correct_word})"
 
-            if game.get('is_solo'):
+            if game.is_solo:
                 message = (
                     f"✅ Correct! ✅\n"
-                    f"🎯 Word: {correct_word}\n"
+                    f"🎯 Word: {solved_word}\n"
                     f"⏱️ Time: {time_taken:.1f}s (+{score} points)\n"
-                    f"💰 Total this game: {game['players'][user_id]} points\n\n"
+                    f"💰 Total this game: {game.players[user_id]} points\n\n"
                     "Next word coming up...")
             else:
                 message = (f"🏆 {user_name} got it!\n"
-                           f"✅ Word: {correct_word}\n"
+                           f"✅ Word: {solved_word}\n"
                            f"⏱️ Time: {time_taken:.1f}s (+{score} points)\n\n"
                            "Next round starting soon...")
 
-            update.message.reply_text(message)
+            # Queued without waiting, so it can go out together with the
+            # next round when the chat is at its rate limit
+            outbox.send(context.bot,
+                        chat_id,
+                        message,
+                        reply_to_message_id=update.message.message_id)
 
             # Send definition separately after a short delay
-            def send_meaning():
+            async def send_meaning():
                 try:
-                    time.sleep(0.5)
-                    context.bot.send_message(
-                        chat_id, f"📖 Definition of {correct_word}: {meaning}")
+                    # Usually prefetched already, otherwise looked up here
+                    meaning = prepared.meaning or await get_word_meaning(
+                        correct_word)
+                    await outbox.send(
+                        context.bot,
+                        chat_id,
+                        f"📖 Definition of {correct_word}: {meaning}",
+                        priority=LOW)
                 except Exception as e:
                     logger.error(f"Error sending meaning: {e}")
 
-            import threading
-            threading.Thread(target=send_meaning).start()
+            timers.call_later(MEANING_DELAY, send_meaning)
 
             # Move to next round or end game
-            game["round"] += 1
-            if game["round"] > game["max_rounds"]:
-                end_game(chat_id, context.bot)
+            game.round += 1
+            if game.round > game.max_rounds:
+                await end_game(chat_id, context.bot)
             else:
-                next_round(chat_id, context.bot)
+                await next_round(chat_id, context.bot)
+        elif correct_word and len(user_guess) == len(correct_word):
+            guesses.inc("wrong_anagram" if result ==
+                        WRONG_ANAGRAM else "same_length")
+            event_log.record(GUESS, chat_id, correct_word, user_id)
+            game.touch()  # A wrong guess still keeps the game alive
     except Exception as e:
         logger.error(f"Error in check_answer: {e}")
-        update.message.reply_text("An error occurred. Please try again.")
+        await update.message.reply_text(
+            "An error occurred. Please try again.")
 
 
-def end_game(chat_id, bot):
+async def end_game(chat_id, bot):
     """End the game and show final scores."""
     try:
         game = active_games[chat_id]
-        players = game["players"]
+        players = game.players
+
+        game.cancel_deadline()
+        prefetcher.stop(chat_id)
+        difficulty_model.forget(chat_id)
 
         if not players:
-            bot.send_message(chat_id, "Game ended with no winners.")
+            outbox.send(bot, chat_id, "Game ended with no winners.")
             del active_games[chat_id]
             return
 
@@ -483,114 +645,214 @@ def end_game(chat_id, bot):
                                 key=lambda x: x[1],
                                 reverse=True)
 
-        if game.get('is_solo'):
+        # Names were cached while playing, so this rarely calls Telegram
+        user_names = await name_cache.resolve(
+            bot, set(players) | {game.solo_player} - {None})
+
+        if game.is_solo:
             # Solo game ending
-            user_id = game['solo_player']
+            user_id = game.solo_player
             score = players.get(user_id, 0)
-            user_name = bot.get_chat(user_id).first_name
+            user_name = user_names[user_id]
 
             # Update global stats
-            if hasattr(bot, 'bot_data'):
-                update_global_stats(user_id, score, bot)
+            update_global_stats(user_id, score, user_name)
 
             message = (f"🎉 Game Over! 🎉\n\n"
                        f"👤 Player: {user_name}\n"
                        f"🏆 Total Score: {score} points\n\n"
                        f"Check /stats to see your updated total points!")
-            bot.send_message(chat_id, message)
+            outbox.send(bot, chat_id, message)
         else:
             # Multiplayer game ending - enhanced display
-            leaderboard_text = "🏆 *Final Scores* 🏆\n\n"
-
-            # Player rankings
-            for i, (user_id, score) in enumerate(sorted_players, 1):
-                user_name = bot.get_chat(user_id).first_name
-                leaderboard_text += f"{i}. {user_name}: {score} points\n"
-
+            for user_id, score in sorted_players:
                 # Update global stats
-                if hasattr(bot, 'bot_data'):
-                    update_global_stats(user_id, score, bot)
-
-            # Additional stats
-            leaderboard_text += "\n🔹 *Game Statistics:*\n"
-
-            # Count of words solved by each player
-            solved_counts = defaultdict(int)
-            for round_num, solver_id in game['solved_by'].items():
-                solved_counts[solver_id] += 1
-
-            for solver_id, count in sorted(solved_counts.items(),
-                                           key=lambda x: x[1],
-                                           reverse=True):
-                if count > 0:
-                    leaderboard_text += f"🔸 {bot.get_chat(solver_id).first_name} solved {count} words\n"
+                update_global_stats(user_id, score, user_names[user_id])
 
-            # Longest word
-            if game['words_used']:
-                longest_word = max(game['words_used'], key=len)
-                leaderboard_text += f"\n📏 Longest word: {longest_word} ({len(longest_word)} letters)"
-
-            bot.send_message(chat_id, leaderboard_text, parse_mode='Markdown')
+            leaderboard_text = messages.final_scores(sorted_players,
+                                                     user_names,
+                                                     game.solved_counts,
+                                                     game.longest_word)
+            outbox.send(bot, chat_id, leaderboard_text, parse_mode='Markdown')
 
         del active_games[chat_id]
     except Exception as e:
         logger.error(f"Error in end_game: {e}")
-        bot.send_message(chat_id, "An error occurred ending the game.")
+        await bot.send_message(chat_id, "An error occurred ending the game.")
 
 
-def error_handler(update: Update, context: CallbackContext):
+async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors gracefully."""
     try:
         raise context.error
     except Exception as e:
         logger.error(f"Error: {e}")
         if update and update.effective_message:
-            update.effective_message.reply_text(
+            await update.effective_message.reply_text(
                 "An error occurred. Please try again later.")
 
 
+async def post_init(application: Application):
+    """Start background tasks once the event loop is running."""
+    startup_mark("initialize")
+    timers.start()
+    loop = asyncio.get_running_loop()
+    # The leaderboard uses SQL until the rank index is built
+    background_tasks.add(
+        loop.create_task(stats_store.load_ranking_in_background()))
+    if SHARDS > 1:
+        # Other shards rate words too; their rounds are read back
+        background_tasks.add(
+            loop.create_task(difficulty_model.refresh_forever()))
+    refill_interval = int(os.getenv('WORD_REFILL_INTERVAL', '0'))
+    if refill_interval > 0:
+        background_tasks.add(
+            loop.create_task(word_bank.refill_forever(refill_interval)))
+    ready = time.perf_counter() - STARTED
+    startup_phases["total"] = ready
+    if ready > STARTUP_BUDGET:
+        logger.warning(f"Startup took {ready:.2f}s, over the "
+                       f"{STARTUP_BUDGET:.0f}s budget")
+    else:
+        logger.info(f"Ready to handle updates after {ready:.2f}s")
+
+
+async def post_stop(application: Application):
+    """Let queued messages go out while the bot can still send them."""
+    await outbox.close()
+
+
+async def post_shutdown(application: Application):
+    """Release shared clients on shutdown."""
+    timers.stop()
+    for task in background_tasks:
+        task.cancel()
+    await http_client.close()
+    definition_cache.close()
+    event_log.close()
+    storage.close()
+
+
+def build_application(token, base_url=None, polling=True):
+    """Create the Application with all handlers registered.
+
+    With polling=False there is no Updater; updates are put on
+    application.update_queue by someone else, e.g. a shard receiver.
+    """
+    # Bot API calls go through InstrumentedRequest so they show in /metrics
+    request = InstrumentedRequest(connection_pool_size=TELEGRAM_POOL_SIZE,
+                                  pool_timeout=10.0)
+    builder = (Application.builder().token(token).persistence(
+        persistence).concurrent_updates(CONCURRENT_UPDATES).request(
+            request).get_updates_request(InstrumentedRequest()).post_init(
+                post_init).post_stop(post_stop).post_shutdown(post_shutdown))
+    if base_url:
+        builder = builder.base_url(base_url)
+    if not polling:
+        builder = builder.updater(None)
+    application = builder.build()
+    registry.collect("anagram_update_queue_depth",
+                     "Updates fetched but not yet handled.",
+                     application.update_queue.qsize)
+
+    # Add error handler
+    application.add_error_handler(error_handler)
+
+    # Command handlers
+    application.add_handler(CommandHandler("start", timed_handler(start)))
+    application.add_handler(
+        CommandHandler("help", timed_handler(help_command)))
+    application.add_handler(CommandHandler("newgame", timed_handler(newgame)))
+    application.add_handler(CommandHandler("newplay", timed_handler(newplay)))
+    application.add_handler(
+        CommandHandler("leaderboard", timed_handler(leaderboard)))
+    application.add_handler(CommandHandler("stats", timed_handler(stats)))
+    application.add_handler(
+        CommandHandler("hint", timed_handler(chat_serialized(hint))))
+
+    # Callback handlers
+    application.add_handler(
+        CallbackQueryHandler(
+            timed_handler(choose_rounds),
+            pattern="^(easy|medium|hard|easy_solo|medium_solo|hard_solo)$"))
+    application.add_handler(
+        CallbackQueryHandler(timed_handler(chat_serialized(start_game)),
+                             pattern="^(10|30|50)$"))
+
+    # Message handler
+    application.add_handler(
+        MessageHandler(
+            RoundCandidate(active_games) & filters.TEXT & ~filters.COMMAND,
+            timed_handler(chat_serialized(check_answer))))
+    return application
+
+
+async def run_webhook(application, url):
+    """Receive updates posted to the keep-alive server at WEBHOOK_PATH."""
+    inbox.max_in_flight = CONCURRENT_UPDATES
+    inbox.prefilter = lambda data: wanted(data, active_games)
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    try:
+        # Without a secret anyone reaching the port could post updates
+        inbox.secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        await application.bot.set_webhook(url,
+                                          secret_token=inbox.secret,
+                                          allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook set to {url}")
+        await inbox.drain(application)
+    finally:
+        inbox.secret = None
+        await application.stop()
+        await post_stop(application)
+        await application.shutdown()
+        await post_shutdown(application)
+
+
 def main():
     """Run the bot."""
+    startup_mark("imports")
     try:
         # Get token from environment variable or use default
         TOKEN = os.getenv('TELEGRAM_TOKEN',
                           '8119846665:AAEntRdHrgcAdgo-89GbgcOD8ZlG8mNLl-E')
 
-        # Set up persistence to save data between restarts
-        persistence = PicklePersistence(filename='anagram_bot_data')
-        updater = Updater(TOKEN, use_context=True, persistence=persistence)
-        dispatcher = updater.dispatcher
-
-        # Add error handler
-        dispatcher.add_error_handler(error_handler)
-
-        # Command handlers
-        dispatcher.add_handler(CommandHandler("start", start))
-        dispatcher.add_handler(CommandHandler("help", help_command))
-        dispatcher.add_handler(CommandHandler("newgame", newgame))
-        dispatcher.add_handler(CommandHandler("newplay", newplay))
-        dispatcher.add_handler(CommandHandler("leaderboard", leaderboard))
-        dispatcher.add_handler(CommandHandler("stats", stats))
-        dispatcher.add_handler(CommandHandler("hint", hint))
-
-        # Callback handlers
-        dispatcher.add_handler(
-            CallbackQueryHandler(
-                choose_rounds,
-                pattern="^(easy|medium|hard|easy_solo|medium_solo|hard_solo)$")
-        )
-        dispatcher.add_handler(
-            CallbackQueryHandler(start_game, pattern="^(10|30|50)$"))
-
-        # Message handler
-        dispatcher.add_handler(
-            MessageHandler(Filters.text & ~Filters.command, check_answer))
+        # Data saved by the old pickle persistence is moved over once
+        import_legacy_pickle(storage)
+        startup_mark("legacy import")
+
+        # Flask is only imported once the server is actually started
+        from keep_alive import keep_alive
+
+        if SHARDS > 1:
+            # Workers build their own Application, see sharding.py
+            logger.info(f"Bot is running with {SHARDS} shards...")
+            keep_alive()
+            run_sharded(TOKEN, SHARDS)
+            return
+
+        # Load the word bank once, it can be topped up from the web later
+        load_words()
+        startup_mark("load words")
 
         # Start the bot
         logger.info("Bot is running...")
         keep_alive()
-        updater.start_polling()
-        updater.idle()
+        startup_mark("keep-alive server")
+        if WEBHOOK_URL:
+            application = build_application(TOKEN, polling=False)
+            startup_mark("build application")
+            try:
+                asyncio.run(
+                    run_webhook(application,
+                                WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH))
+            except KeyboardInterrupt:
+                pass
+        else:
+            application = build_application(TOKEN)
+            startup_mark("build application")
+            application.run_polling()
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
 
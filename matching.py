@@ -0,0 +1,61 @@
+"""Cheap checks that decide whether a chat message can answer a round.
+
+Most group messages are chatter. They are rejected by the length of the
+current word, before PTB runs the answer handler, and in webhook and
+sharded mode before the raw update is even parsed.
+"""
+from telegram.ext import filters
+
+from anagrams import anagram_index, signature
+
+NO_MATCH = 0
+WRONG_ANAGRAM = 1  # Same letters as the word, but not a dictionary word
+CORRECT = 2  # The word, or another dictionary word with its letters
+
+
+def match(game, guess):
+    """Classify a lowercased guess against the round of a GameState."""
+    word = game.current_word
+    if word is None or len(guess) != len(word):
+        return NO_MATCH
+    if guess == word:
+        return CORRECT
+    if signature(guess) != game.signature:
+        return NO_MATCH
+    if guess in anagram_index.words(game.signature):
+        return CORRECT
+    return WRONG_ANAGRAM
+
+
+def _round_length(games, chat_id):
+    game = games.get(chat_id)
+    if game is None or game.current_word is None:
+        return None
+    return len(game.current_word)
+
+
+class RoundCandidate(filters.MessageFilter):
+    """Passes text messages as long as the word of their chat's round."""
+
+    def __init__(self, games):
+        super().__init__(name="RoundCandidate")
+        self.games = games
+
+    def filter(self, message):
+        return (message.text is not None and len(message.text)
+                == _round_length(self.games, message.chat_id))
+
+
+def wanted(data, games):
+    """False for a raw update that is plain text nobody handles.
+
+    Commands, callbacks and anything else still go through; only text
+    messages that cannot answer the round of their chat are dropped.
+    """
+    message = data.get('message')
+    if message is None or len(data) != 2:
+        return True
+    text = message.get('text')
+    if text is None or text.startswith('/'):
+        return True
+    return len(text) == _round_length(games, message['chat']['id'])
@@ -0,0 +1,104 @@
+"""Texts and keyboards the bot sends.
+
+Replies that never change, and the inline keyboards, are built once at
+import. Boards are assembled with join instead of repeated concatenation,
+and the rendered all-time top list is kept until the stats store reports
+that it may have changed.
+"""
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+WELCOME = ("🌟 Welcome {name} to Anagram Challenge! 🌟\n\n"
+           "🧠 Test your word skills by unscrambling letters!\n\n"
+           "📌 Available Commands:\n"
+           "/help - How to play\n"
+           "/newgame - Start a new game in groups\n"
+           "/newplay - Play solo in private chat\n"
+           "/leaderboard - Top players of all time\n"
+           "/stats - Your personal statistics\n\n"
+           "🏆 Compete with friends and climb the leaderboard!")
+
+HELP = ("📖 How to Play Anagram Challenge:\n\n"
+        "1. Start a game with /newgame (in groups) or /newplay (in private)\n"
+        "2. You'll see scrambled letters of a word\n"
+        "3. Type the correct word to earn points\n"
+        "4. Faster answers earn more points!\n\n"
+        "💡 Tips:\n"
+        "- Use /hint to get help with the current word\n"
+        "- Check /leaderboard to see top players\n"
+        "- Your points accumulate across all games!")
+
+NO_LEADERBOARD = "No leaderboard data yet. Be the first to play!"
+
+ROUND_FOOTER = {
+    True: "⏳ Faster answers earn more points!\n💡 Use /hint to get help",
+    False:
+    "⏳ Fastest correct answer wins points!\n💡 Use /hint to get help",
+}
+
+
+def _keyboard(*buttons):
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(label, callback_data=data)]
+         for label, data in buttons])
+
+
+DIFFICULTY_KEYBOARD = _keyboard(("Easy", "easy"), ("Medium", "medium"),
+                                ("Hard", "hard"))
+SOLO_DIFFICULTY_KEYBOARD = _keyboard(("Easy", "easy_solo"),
+                                     ("Medium", "medium_solo"),
+                                     ("Hard", "hard_solo"))
+ROUNDS_KEYBOARD = _keyboard(("10 Rounds", "10"), ("30 Rounds", "30"),
+                            ("50 Rounds", "50"))
+
+
+def welcome(first_name):
+    return WELCOME.format(name=first_name)
+
+
+def round_announcement(round_number, max_rounds, scrambled, is_solo):
+    return (f"🔤 Round {round_number}/{max_rounds}\n"
+            f"Unscramble this word: {scrambled}\n\n" + ROUND_FOOTER[is_solo])
+
+
+def leaderboard(players):
+    """The all-time top list from [(user_id, stats)], best first."""
+    lines = ["🏆 All-Time Leaderboard 🏆\n"]
+    lines.extend(f"{i}. {stats['name']}: {stats['points']} points"
+                 for i, (_, stats) in enumerate(players, 1))
+    return "\n".join(lines) + "\n"
+
+
+def final_scores(sorted_players, names, solved_counts, longest_word):
+    """Markdown board of a finished multiplayer game."""
+    parts = ["🏆 *Final Scores* 🏆\n\n"]
+    parts.extend(f"{i}. {names[user_id]}: {score} points\n"
+                 for i, (user_id, score) in enumerate(sorted_players, 1))
+    parts.append("\n🔹 *Game Statistics:*\n")
+    parts.extend(
+        f"🔸 {names[solver_id]} solved {count} words\n"
+        for solver_id, count in sorted(
+            solved_counts.items(), key=lambda x: x[1], reverse=True)
+        if count > 0)
+    if longest_word:
+        parts.append(f"\n📏 Longest word: {longest_word} "
+                     f"({len(longest_word)} letters)")
+    return "".join(parts)
+
+
+class LeaderboardCache:
+    """Rendered top list, reused while the store's top_version is unchanged."""
+
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self._version = None
+        self._text = None
+
+    def text(self):
+        """The rendered board, or None if nobody has played yet."""
+        version = self.store.top_version
+        if version != self._version:
+            players = self.store.top(self.size)
+            self._text = leaderboard(players) if players else None
+            self._version = version
+        return self._text
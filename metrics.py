@@ -0,0 +1,185 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Each metric has a single writer at a time (the event loop, or storage
+writes serialized by their own lock), so updates are plain integer and
+float additions with no locking. The keep-alive server renders them from
+its own thread by copying each series first; a scrape may see a
+half-applied observation, which is fine for monitoring.
+"""
+import bisect
+import time
+
+# Seconds; fine at the low end where handlers usually finish
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # {label values: count}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if not self.labelnames and not self._values:
+            yield self.name, "", 0
+        for labels, value in list(self._values.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # {label values: [per-bucket counts..., +Inf, sum]}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels):
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'), )
+        series_items = list(self._series.items())
+        if not self.labelnames and not series_items:
+            series_items = [((), [0] * len(bounds) + [0.0])]
+        for labels, series in series_items:
+            series = list(series)
+            total = 0
+            for bound, count in zip(bounds, series):
+                total += count
+                yield (f"{self.name}_bucket",
+                       _labels(self.labelnames, labels,
+                               [("le", _number(bound))]), total)
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), series[-1]
+            yield f"{self.name}_count", _labels(self.labelnames, labels), total
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Collected:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a {label values: number} mapping
+    when `labelnames` is given.
+    """
+
+    def __init__(self, name, help_text, kind, callback, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.callback()
+        if not self.labelnames:
+            yield self.name, "", value
+            return
+        for labels, item in list(value.items()):
+            if not isinstance(labels, tuple):
+                labels = (labels, )
+            yield self.name, _labels(self.labelnames, labels), item
+
+
+class Registry:
+    """Named metrics, in registration order."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # Re-registering returns the existing metric, e.g. on module reload
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(),
+                  buckets=LATENCY_BUCKETS):
+        return self._register(
+            Histogram(name, help_text, labelnames, buckets))
+
+    def collect(self, name, help_text, callback, kind="gauge", labelnames=()):
+        """Register a value computed on every scrape; replaces any earlier one."""
+        metric = self._metrics[name] = Collected(name, help_text, kind,
+                                                 callback, labelnames)
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,74 @@
+"""Display names of players, cached from the updates they send."""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+NAME_TTL = float(os.getenv('NAME_CACHE_TTL', str(24 * 3600)))
+MAX_NAMES = 100000
+
+
+class NameCache:
+    """Bounded LRU of user_id -> first_name with a time to live.
+
+    Names are remembered whenever a user talks to the bot, so rendering a
+    game's results normally needs no Telegram API calls at all.
+    """
+
+    def __init__(self, ttl=NAME_TTL, max_entries=MAX_NAMES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._names = OrderedDict()  # {user_id: (first_name, seen_at)}
+
+    def remember(self, user):
+        """Store the name of a telegram.User."""
+        if user is None:
+            return
+        self._names[user.id] = (user.first_name, time.monotonic())
+        self._names.move_to_end(user.id)
+        while len(self._names) > self.max_entries:
+            self._names.popitem(last=False)
+
+    def get(self, user_id):
+        """Return a fresh cached name, or None."""
+        entry = self._names.get(user_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        self._names.move_to_end(user_id)
+        return entry[0]
+
+    async def resolve(self, bot, user_ids):
+        """Return {user_id: name}, looking up unknown users concurrently."""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        self.hits += len(names)
+        self.misses += len(missing)
+
+        if missing:
+            chats = await asyncio.gather(
+                *(bot.get_chat(user_id) for user_id in missing),
+                return_exceptions=True)
+            for user_id, chat in zip(missing, chats):
+                if isinstance(chat, Exception):
+                    logger.warning(f"Failed to look up user {user_id}: {chat}")
+                    # Keep an expired name rather than showing nothing
+                    entry = self._names.get(user_id)
+                    names[user_id] = entry[0] if entry else f"Player {user_id}"
+                else:
+                    self.remember(chat)
+                    names[user_id] = chat.first_name
+        return names
+
+
+name_cache = NameCache()
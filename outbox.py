@@ -0,0 +1,251 @@
+"""Rate-limited outgoing messages, merged per chat when they pile up.
+
+Telegram allows about one message per second in a chat, twenty per minute
+in a group and thirty per second overall. Every chat with queued messages
+gets a pump task that waits for a token from its own bucket and from the
+global one, then sends everything queued for the chat meanwhile as one
+message. Higher priority messages go first, a 429 pauses the chat for the
+time Telegram asks for, and transient network errors are retried.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Messages per second and burst sizes
+GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+GLOBAL_BURST = int(os.getenv('SEND_GLOBAL_BURST', '30'))
+CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', '3'))
+GROUP_RATE = float(os.getenv('SEND_GROUP_RATE', str(20 / 60)))
+GROUP_BURST = int(os.getenv('SEND_GROUP_BURST', '5'))
+MAX_ATTEMPTS = 3
+MAX_TEXT_LENGTH = 4096
+SEPARATOR = "\n\n"
+
+# Priorities; definitions can wait behind round announcements
+NORMAL, LOW = 0, 1
+
+sent_messages = registry.counter("anagram_outbox_sent_total",
+                                 "Messages sent by the outbox.")
+merged_messages = registry.counter(
+    "anagram_outbox_merged_total",
+    "Queued messages folded into an earlier one instead of being sent.")
+send_retries = registry.counter("anagram_outbox_retries_total",
+                                "Sends retried, by reason.", ("reason", ))
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`.
+
+    reserve() always takes a token and returns how long to wait before
+    using it, so concurrent callers queue up instead of racing.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """Make the next reservation wait at least `seconds`."""
+        self._refill()
+        self.tokens = min(self.tokens, 1.0) - seconds * self.rate
+
+    def time_to_full(self):
+        self._refill()
+        return (self.burst - self.tokens) / self.rate
+
+
+class OutgoingMessage:
+    __slots__ = ("priority", "seq", "text", "parse_mode", "reply_to",
+                 "reply_markup", "attempts", "futures")
+
+    def __init__(self, priority, seq, text, parse_mode, reply_to,
+                 reply_markup, future):
+        self.priority = priority
+        self.seq = seq
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_to = reply_to
+        self.reply_markup = reply_markup
+        self.attempts = 0
+        self.futures = [future]
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def absorb(self, other):
+        """Append another message's text if they can be sent as one."""
+        if (other.reply_markup is not None or self.reply_markup is not None
+                or other.parse_mode != self.parse_mode
+                or len(self.text) + len(SEPARATOR) + len(other.text) >
+                MAX_TEXT_LENGTH):
+            return False
+        self.text += SEPARATOR + other.text
+        self.futures += other.futures
+        return True
+
+
+class _ChatQueue:
+    __slots__ = ("bot", "messages", "bucket", "pump")
+
+    def __init__(self, bot, bucket):
+        self.bot = bot
+        self.messages = []  # heap of OutgoingMessage
+        self.bucket = bucket
+        self.pump = None
+
+
+def _consume(future):
+    # Failures are logged by the pump; nobody has to await a send
+    if not future.cancelled():
+        future.exception()
+
+
+class Outbox:
+    """Per-chat send queues sharing one global rate limit."""
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats = {}  # {chat_id: _ChatQueue}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(
+            len(queue.messages) for queue in list(self._chats.values()))
+
+    def send(self,
+             bot,
+             chat_id,
+             text,
+             priority=NORMAL,
+             parse_mode=None,
+             reply_to_message_id=None,
+             reply_markup=None):
+        """Queue a message; the returned future gives the sent Message."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            if chat_id < 0:
+                bucket = TokenBucket(GROUP_RATE, GROUP_BURST)
+            else:
+                bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+            queue = self._chats[chat_id] = _ChatQueue(bot, bucket)
+        heapq.heappush(
+            queue.messages,
+            OutgoingMessage(priority, next(self._seq), text, parse_mode,
+                            reply_to_message_id, reply_markup, future))
+        if queue.pump is None:
+            queue.pump = asyncio.create_task(self._pump(chat_id, queue))
+        return future
+
+    def _next_batch(self, queue):
+        """Pop the first message with every later one it can absorb."""
+        batch = heapq.heappop(queue.messages)
+        while queue.messages and batch.absorb(queue.messages[0]):
+            heapq.heappop(queue.messages)
+            merged_messages.inc()
+        return batch
+
+    async def _pump(self, chat_id, queue):
+        try:
+            while queue.messages:
+                # Messages queued while waiting for tokens get merged
+                await asyncio.sleep(queue.bucket.reserve())
+                await asyncio.sleep(self.global_bucket.reserve())
+                batch = self._next_batch(queue)
+                await self._deliver(chat_id, queue, batch)
+        except asyncio.CancelledError:
+            for message in queue.messages:
+                for future in message.futures:
+                    future.cancel()
+            queue.messages.clear()
+            raise
+        finally:
+            queue.pump = None
+            # Keep the chat's bucket until it refills, or a new message
+            # would start with a full burst right after the last one
+            asyncio.get_running_loop().call_later(
+                queue.bucket.time_to_full(), self._forget, chat_id, queue)
+
+    def _forget(self, chat_id, queue):
+        if (self._chats.get(chat_id) is queue and queue.pump is None
+                and not queue.messages):
+            del self._chats[chat_id]
+
+    async def _deliver(self, chat_id, queue, batch):
+        try:
+            message = await queue.bot.send_message(
+                chat_id,
+                batch.text,
+                parse_mode=batch.parse_mode,
+                reply_to_message_id=batch.reply_to,
+                allow_sending_without_reply=True,
+                reply_markup=batch.reply_markup)
+        except RetryAfter as e:
+            logger.warning(f"Flood limit in chat {chat_id}, "
+                           f"waiting {e.retry_after}s")
+            send_retries.inc("flood")
+            queue.bucket.pause(e.retry_after)
+            heapq.heappush(queue.messages, batch)
+        except NetworkError as e:
+            # A timed out send may have arrived, so it is not repeated
+            batch.attempts += 1
+            if isinstance(e, TimedOut) or batch.attempts >= MAX_ATTEMPTS:
+                self._fail(chat_id, batch, e)
+            else:
+                send_retries.inc("network")
+                queue.bucket.pause(batch.attempts)  # Back off 1s, 2s, ...
+                heapq.heappush(queue.messages, batch)
+        except Exception as e:
+            self._fail(chat_id, batch, e)
+        else:
+            sent_messages.inc()
+            for future in batch.futures:
+                if not future.done():
+                    future.set_result(message)
+
+    @staticmethod
+    def _fail(chat_id, batch, error):
+        logger.error(f"Failed to send to chat {chat_id}: {error}")
+        for future in batch.futures:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self, timeout=5.0):
+        """Give queued messages `timeout` seconds to go out, then drop them."""
+        pumps = [queue.pump for queue in list(self._chats.values())
+                 if queue.pump is not None]
+        if not pumps:
+            return
+        done, pending = await asyncio.wait(pumps, timeout=timeout)
+        for pump in pending:
+            pump.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+outbox = Outbox()
@@ -0,0 +1,102 @@
+"""Per-game queues of ready-made rounds filled in the background."""
+import asyncio
+import logging
+import random
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedRound:
+    """A round ready to be played. meaning is None until it has been fetched."""
+
+    __slots__ = ("word", "scrambled", "meaning")
+
+    def __init__(self, word, scrambled, meaning=None):
+        self.word = word
+        self.scrambled = scrambled
+        self.meaning = meaning
+
+
+class _GameQueue:
+    __slots__ = ("chat_id", "difficulty", "rng", "rounds", "tasks")
+
+    def __init__(self, chat_id, difficulty, rng=random):
+        self.chat_id = chat_id
+        self.difficulty = difficulty
+        self.rng = rng
+        self.rounds = deque()
+        self.tasks = set()
+
+
+class RoundPrefetcher:
+    """Keeps the next `depth` rounds of every active game prepared.
+
+    Words and scrambles come from the local word bank and are queued at
+    once; definitions are then resolved by background tasks, so a round
+    transition only pops from a deque. make_word is called with the
+    difficulty, the chat id and the game's RNG, scramble with the word and
+    the RNG.
+    """
+
+    def __init__(self, make_word, scramble, get_meaning, depth=3):
+        self.make_word = make_word
+        self.scramble = scramble
+        self.get_meaning = get_meaning
+        self.depth = depth
+        self._games = {}  # {chat_id: _GameQueue}
+        self.empty_takes = 0  # rounds that had to be prepared inline
+
+    def _prepare(self, queue):
+        word = self.make_word(queue.difficulty, queue.chat_id, queue.rng)
+        return PreparedRound(word, self.scramble(word, queue.rng))
+
+    async def _resolve_meaning(self, prepared):
+        try:
+            prepared.meaning = await self.get_meaning(prepared.word)
+        except Exception as e:
+            logger.warning(f"Error prefetching meaning of {prepared.word}: {e}")
+
+    def _top_up(self, queue):
+        while len(queue.rounds) < self.depth:
+            try:
+                prepared = self._prepare(queue)
+            except Exception as e:
+                logger.error(f"Error preparing round: {e}")
+                return
+            queue.rounds.append(prepared)
+            task = asyncio.get_running_loop().create_task(
+                self._resolve_meaning(prepared))
+            queue.tasks.add(task)
+            task.add_done_callback(queue.tasks.discard)
+
+    def start(self, chat_id, difficulty, rng=random):
+        """Begin prefetching for a new game, dropping any previous queue."""
+        self.stop(chat_id)
+        queue = self._games[chat_id] = _GameQueue(chat_id, difficulty, rng)
+        self._top_up(queue)
+
+    def stop(self, chat_id):
+        """Forget the queue of a finished game and cancel its pending lookups."""
+        queue = self._games.pop(chat_id, None)
+        if queue is not None:
+            for task in list(queue.tasks):
+                task.cancel()
+
+    def take(self, chat_id, difficulty):
+        """Pop the next prepared round, preparing one inline if none is ready."""
+        queue = self._games.get(chat_id)
+        if queue is None:
+            queue = self._games[chat_id] = _GameQueue(chat_id, difficulty)
+        if queue.rounds:
+            prepared = queue.rounds.popleft()
+        else:
+            logger.info(f"Prefetch queue empty for chat {chat_id}")
+            self.empty_takes += 1
+            prepared = self._prepare(queue)
+        self._top_up(queue)
+        return prepared
+
+    def queued(self):
+        """Prepared rounds waiting across all games."""
+        return sum(len(queue.rounds) for queue in list(self._games.values()))
@@ -0,0 +1,140 @@
+"""Order-statistics index over all-time points, used by the leaderboard."""
+from bisect import bisect_left, insort
+
+# Chunks are split once they hold twice this many entries
+LOAD = 512
+# Telegram user ids fit in 52 bits, so (points, user_id) packs into one int
+_ID_BITS = 53
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def _key(user_id, points):
+    # Ascending keys mean descending points, ties broken by user id
+    return -points * (1 << _ID_BITS) + user_id
+
+
+def _unkey(key):
+    return key & _ID_MASK, -(key >> _ID_BITS)
+
+
+class RankIndex:
+    """Players ordered by points, highest first.
+
+    Entries live in sorted chunks of a few hundred ints and a Fenwick tree
+    over the chunk sizes gives the number of players ahead of any chunk,
+    so add/remove/rank are O(log n) and reading the top K is O(K).
+    """
+
+    def __init__(self):
+        self._chunks = []  # sorted lists of keys
+        self._maxes = []  # last key of every chunk
+        self._tree = []  # Fenwick tree over len(chunk), 1-based
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _rebuild_tree(self):
+        tree = [0] + [len(chunk) for chunk in self._chunks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, index, delta):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _players_before(self, index):
+        """Number of entries in the chunks before chunks[index]."""
+        total = 0
+        i = index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def build(self, ranked):
+        """Replace the contents with (user_id, points) pairs in rank order."""
+        self._chunks = []
+        chunk = []
+        for user_id, points in ranked:
+            chunk.append(_key(user_id, points))
+            if len(chunk) == LOAD:
+                self._chunks.append(chunk)
+                chunk = []
+        if chunk:
+            self._chunks.append(chunk)
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = sum(len(chunk) for chunk in self._chunks)
+        self._rebuild_tree()
+
+    def add(self, user_id, points):
+        key = _key(user_id, points)
+        self._len += 1
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            return
+
+        index = bisect_left(self._maxes, key)
+        if index == len(self._chunks):
+            index -= 1
+        chunk = self._chunks[index]
+        insort(chunk, key)
+        self._maxes[index] = chunk[-1]
+
+        if len(chunk) > 2 * LOAD:
+            self._chunks[index:index + 1] = [chunk[:LOAD], chunk[LOAD:]]
+            self._maxes[index:index + 1] = [chunk[LOAD - 1], chunk[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(index, 1)
+
+    def _locate(self, user_id, points):
+        key = _key(user_id, points)
+        index = bisect_left(self._maxes, key)
+        if index < len(self._chunks):
+            chunk = self._chunks[index]
+            position = bisect_left(chunk, key)
+            if position < len(chunk) and chunk[position] == key:
+                return index, position
+        raise KeyError(user_id)
+
+    def remove(self, user_id, points):
+        index, position = self._locate(user_id, points)
+        chunk = self._chunks[index]
+        del chunk[position]
+        self._len -= 1
+        if chunk:
+            self._maxes[index] = chunk[-1]
+            self._tree_add(index, -1)
+        else:
+            del self._chunks[index]
+            del self._maxes[index]
+            self._rebuild_tree()
+
+    def update(self, user_id, old_points, new_points):
+        """Move a player after their points changed; old_points may be None."""
+        if old_points is not None:
+            self.remove(user_id, old_points)
+        self.add(user_id, new_points)
+
+    def rank(self, user_id, points):
+        """Return the 1-based position of a player with the given points."""
+        index, position = self._locate(user_id, points)
+        return self._players_before(index) + position + 1
+
+    def top(self, limit):
+        """Return [(user_id, points)] of the first `limit` players."""
+        result = []
+        for chunk in self._chunks:
+            for key in chunk:
+                if len(result) == limit:
+                    return result
+                result.append(_unkey(key))
+        return result
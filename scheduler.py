@@ -0,0 +1,112 @@
+"""Hashed timer wheel that runs every delayed action of the bot."""
+import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """Handle of a scheduled callback."""
+
+    __slots__ = ("callback", "args", "rounds", "cancelled")
+
+    def __init__(self, callback, args, rounds):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Timers hashed into `slots` buckets of `tick` seconds each.
+
+    Scheduling and cancelling are O(1) and one asyncio task walks a single
+    bucket per tick, so tens of thousands of pending deadlines cost almost
+    nothing. Timers further away than one revolution wait out the extra
+    `rounds`. Callbacks may be plain functions or coroutine functions; the
+    latter are run as tasks.
+    """
+
+    def __init__(self, tick=0.1, slots=600):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._cursor = 0
+        self._pending = 0
+        self._task = None
+        self._running_tasks = set()
+
+    def __len__(self):
+        return self._pending
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) after roughly `delay` seconds."""
+        ticks = max(1, round(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self._slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self._slots)
+        timer = Timer(callback, args, rounds)
+        index = (self._cursor + offset) % len(self._slots)
+        self._slots[index].append(timer)
+        self._pending += 1
+        return timer
+
+    def _fire(self, timer):
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._running_tasks.add(task)
+                task.add_done_callback(self._task_done)
+        except Exception as e:
+            logger.error(f"Error in timer {timer.callback.__name__}: {e}")
+
+    def _task_done(self, task):
+        self._running_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error in timer task: {task.exception()}")
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        if not slot:
+            return
+        # Swap in a fresh list first so callbacks can schedule into it
+        waiting = self._slots[self._cursor] = []
+        for timer in slot:
+            if timer.cancelled:
+                self._pending -= 1
+            elif timer.rounds > 0:
+                timer.rounds -= 1
+                waiting.append(timer)
+            else:
+                self._pending -= 1
+                self._fire(timer)
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Catch up on ticks missed while the loop was busy
+            now = time.monotonic()
+            while next_tick <= now:
+                self._advance()
+                next_tick += self.tick
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running_tasks:
+            task.cancel()
+
+
+timers = TimerWheel()
@@ -0,0 +1,140 @@
+"""Sharded mode: one update receiver feeding a worker process per shard.
+
+The receiver long-polls Telegram and routes every update by chat id, so
+all updates of a chat reach the same worker, in order, and each worker
+owns the games of its chats. Global stats and the leaderboard live in the
+shared SQLite database (see storage.SharedStatsStore).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Updates waiting per worker before the receiver stops fetching more
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', '10000'))
+POLL_TIMEOUT = 30
+
+
+def shard_for(update, shards):
+    """Index of the worker that owns the chat of an update."""
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif update.effective_user is not None:
+        key = update.effective_user.id
+    else:
+        key = 0
+    return key % shards
+
+
+def run_sharded(token, shards, base_url=None):
+    """Start `shards` worker processes and feed them until interrupted."""
+    # Workers are spawned, not forked, so none inherits the receiver's loop
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(SHARD_QUEUE_SIZE) for _ in range(shards)]
+    workers = [
+        context.Process(target=run_worker,
+                        args=(token, index, shard_queue, base_url),
+                        name=f"shard-{index}")
+        for index, shard_queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        asyncio.run(receive(token, queues, base_url))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for shard_queue in queues:
+            shard_queue.put(None)
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                worker.terminate()
+
+
+async def receive(token, queues, base_url=None):
+    """Long-poll getUpdates and hand each update to its shard."""
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    offset = None
+    async with bot:
+        await bot.delete_webhook()
+        logger.info(f"Receiver routing updates to {len(queues)} shards")
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=POLL_TIMEOUT,
+                        read_timeout=POLL_TIMEOUT + 5,
+                        allowed_updates=Update.ALL_TYPES)
+                except RetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except NetworkError as e:
+                    logger.warning(f"Error fetching updates: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    offset = update.update_id + 1
+                    await _route(update, queues)
+        finally:
+            if offset is not None:
+                # Confirm what was routed so it is not delivered again
+                await bot.get_updates(offset=offset, timeout=0)
+
+
+async def _route(update, queues):
+    shard_queue = queues[shard_for(update, len(queues))]
+    data = update.to_dict()
+    try:
+        shard_queue.put_nowait(data)
+    except queue.Full:
+        # A worker is behind; wait for room instead of dropping updates
+        await asyncio.to_thread(shard_queue.put, data)
+
+
+def run_worker(token, index, shard_queue, base_url=None):
+    """Entry point of a worker process."""
+    # Ctrl+C reaches every process; workers drain and stop on the sentinel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_shard(token, index, shard_queue, base_url))
+
+
+async def serve_shard(token, index, shard_queue, base_url=None):
+    """Run the bot's handlers on the updates of one shard."""
+    # Imported here so only workers set up the bot's state
+    import main
+    import matching
+
+    main.startup_mark("imports")
+    main.load_words()
+    main.startup_mark("load words")
+    application = main.build_application(token,
+                                         base_url=base_url,
+                                         polling=False)
+    main.startup_mark("build application")
+    await application.initialize()
+    await main.post_init(application)
+    await application.start()
+    logger.info(f"Shard {index} is running")
+    try:
+        while True:
+            data = await asyncio.to_thread(shard_queue.get)
+            if data is None:
+                break
+            if not matching.wanted(data, main.active_games):
+                continue
+            await application.update_queue.put(
+                Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await main.post_stop(application)
+        await application.shutdown()
+        await main.post_shutdown(application)
@@ -0,0 +1,603 @@
+"""SQLite storage: batched incremental persistence and per-user global stats."""
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from metrics import registry
+from ranking import RankIndex
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = os.getenv('BOT_DB', 'anagram_bot.db')
+LEGACY_PICKLE_FILE = 'anagram_bot_data'
+# Writes are coalesced and committed at most this often
+FLUSH_INTERVAL = float(os.getenv('BOT_DB_FLUSH_INTERVAL', '2'))
+# More than one worker process shares the database in sharded mode
+SHARDS = int(os.getenv('BOT_SHARDS', '1'))
+# Players on the leaderboard; StatsStore.top_version tracks changes to them
+TOP_SIZE = 10
+
+flush_seconds = registry.histogram("anagram_storage_flush_seconds",
+                                   "Time to commit one batch of writes.")
+flushed_rows = registry.counter("anagram_storage_flushed_rows_total",
+                                "Rows written by storage flushes.")
+flush_failures = registry.counter("anagram_storage_flush_failures_total",
+                                  "Storage flushes that failed and were retried.")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (
+    chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bot_data (
+    key TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS word_ratings (
+    word TEXT PRIMARY KEY, total_seconds REAL NOT NULL,
+    rounds INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS global_stats (
+    user_id INTEGER PRIMARY KEY,
+    points INTEGER NOT NULL,
+    games_played INTEGER NOT NULL,
+    name TEXT);
+CREATE INDEX IF NOT EXISTS global_stats_rank
+    ON global_stats (points DESC, user_id);
+"""
+
+_UPSERTS = {
+    'user_data':
+    "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+    'chat_data':
+    "INSERT OR REPLACE INTO chat_data (chat_id, data) VALUES (?, ?)",
+    'bot_data': "INSERT OR REPLACE INTO bot_data (key, data) VALUES (?, ?)",
+    'word_ratings':
+    "INSERT OR REPLACE INTO word_ratings (word, total_seconds, rounds) "
+    "VALUES (?, ?, ?)",
+    # Round times add up, so shards rating the same word all count
+    'word_ratings_delta':
+    "INSERT INTO word_ratings (word, total_seconds, rounds) "
+    "VALUES (?, ?, ?) ON CONFLICT (word) DO UPDATE SET "
+    "total_seconds = total_seconds + excluded.total_seconds, "
+    "rounds = rounds + excluded.rounds",
+    'global_stats':
+    "INSERT OR REPLACE INTO global_stats "
+    "(user_id, points, games_played, name) VALUES (?, ?, ?, ?)",
+    # Adds to the stored totals, so several processes can write safely
+    'global_stats_delta':
+    "INSERT INTO global_stats (user_id, points, games_played, name) "
+    "VALUES (?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET "
+    "points = points + excluded.points, "
+    "games_played = games_played + excluded.games_played, "
+    "name = COALESCE(excluded.name, name)",
+}
+_DELETES = {
+    'user_data': "DELETE FROM user_data WHERE user_id = ?",
+    'chat_data': "DELETE FROM chat_data WHERE chat_id = ?",
+    'bot_data': "DELETE FROM bot_data WHERE key = ?",
+}
+
+
+def _add_stats(queued, row):
+    user_id, points, games_played, name = row
+    return (user_id, queued[1] + points, queued[2] + games_played, name
+            or queued[3])
+
+
+def _add_times(queued, row):
+    word, seconds, rounds = row
+    return (word, queued[1] + seconds, queued[2] + rounds)
+
+
+# Tables whose queued rows combine with, instead of replace, earlier ones
+_MERGES = {
+    'global_stats_delta': _add_stats,
+    'word_ratings_delta': _add_times,
+}
+
+
+class SQLiteStore:
+    """A WAL-mode SQLite database whose writes are batched per interval.
+
+    Callers queue rows with `put`/`delete`; the latest value for each key
+    wins (delta tables in _MERGES add up instead) and everything queued
+    within FLUSH_INTERVAL goes out in a single transaction on a worker
+    thread.
+    """
+
+    def __init__(self, path=DB_FILE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._db = None
+        self._lock = threading.Lock()
+        self._pending = defaultdict(dict)  # {table: {key: row or None}}
+        self._flush_task = None
+        self._flush_lock = None
+
+    def connect(self):
+        with self._lock:
+            if self._db is None:
+                self._db = sqlite3.connect(self.path,
+                                           check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.executescript(_SCHEMA)
+                self._db.commit()
+            return self._db
+
+    def query(self, sql, params=()):
+        db = self.connect()
+        with self._lock:
+            return db.execute(sql, params).fetchall()
+
+    def iter_rows(self, sql, params=(), batch_size=1000):
+        """Yield rows of a query in batches without loading them all."""
+        db = self.connect()
+        with self._lock:
+            cursor = db.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def put(self, table, key, row):
+        """Queue an upsert; row is the full tuple of column values."""
+        rows = self._pending[table]
+        if table in _MERGES and rows.get(key) is not None:
+            row = _MERGES[table](rows[key], row)
+        rows[key] = row
+        self._schedule_flush()
+
+    def delete(self, table, key):
+        self._pending[table][key] = None
+        self._schedule_flush()
+
+    def pending_rows(self):
+        """Rows queued for the next flush."""
+        return sum(len(rows) for rows in list(self._pending.values()))
+
+    def pending(self, table, key):
+        """The row queued for key, or None."""
+        rows = self._pending.get(table)
+        return rows.get(key) if rows else None
+
+    def _schedule_flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No loop, e.g. a migration script: flush() explicitly
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _write(self, batch):
+        db = self.connect()
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                for table, rows in batch.items():
+                    upserts = [row for row in rows.values() if row is not None]
+                    deletes = [(key, ) for key, row in rows.items()
+                               if row is None]
+                    if upserts:
+                        db.executemany(_UPSERTS[table], upserts)
+                    if deletes:
+                        db.executemany(_DELETES[table], deletes)
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+        flush_seconds.observe(time.perf_counter() - started)
+        flushed_rows.inc(amount=sum(len(rows) for rows in batch.values()))
+
+    def flush_sync(self):
+        batch, self._pending = self._pending, defaultdict(dict)
+        if batch:
+            self._write(batch)
+        return sum(len(rows) for rows in batch.values())
+
+    async def flush(self):
+        """Write everything queued so far in one transaction."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        # Batches must reach the database in the order they were taken
+        async with self._flush_lock:
+            batch, self._pending = self._pending, defaultdict(dict)
+            if not batch:
+                return 0
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} tables: {e}")
+                flush_failures.inc()
+                # Put the rows back unless newer values were queued meanwhile
+                for table, rows in batch.items():
+                    pending = self._pending[table]
+                    for key, row in rows.items():
+                        if table in _MERGES and pending.get(key) is not None:
+                            pending[key] = _MERGES[table](row, pending[key])
+                        else:
+                            pending.setdefault(key, row)
+                self._schedule_flush()
+                return 0
+            return sum(len(rows) for rows in batch.values())
+
+    def close(self):
+        self.flush_sync()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class StatsStore:
+    """All-time points per user, one row each, loaded only when asked for.
+
+    Ranks come from an in-memory RankIndex, built from the points column
+    on first use and then kept current by record_game.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}  # {user_id: {'points', 'games_played', 'name'}}
+        self._ranking = None
+        # [(user_id, old points, new points)] while the ranking is built
+        self._journal = None
+        self._top_version = 0
+
+    @property
+    def top_version(self):
+        """Changes whenever top(TOP_SIZE) may have changed."""
+        return self._top_version
+
+    @staticmethod
+    def _from_row(row):
+        return {'points': row[1], 'games_played': row[2], 'name': row[3]}
+
+    def get(self, user_id):
+        """Return the stats dict of a user, or None if they never played."""
+        stats = self._cache.get(user_id)
+        if stats is None:
+            rows = self.store.query(
+                "SELECT user_id, points, games_played, name "
+                "FROM global_stats WHERE user_id = ?", (user_id, ))
+            if not rows:
+                return None
+            stats = self._cache[user_id] = self._from_row(rows[0])
+        return stats
+
+    def record_game(self, user_id, points, name):
+        """Add a finished game's points, creating the user if needed."""
+        stats = self.get(user_id)
+        old_points = None if stats is None else stats['points']
+        if stats is None:
+            stats = self._cache[user_id] = {
+                'points': 0,
+                'games_played': 0,
+                'name': name
+            }
+        stats['points'] += points
+        stats['games_played'] += 1
+        if name:
+            stats['name'] = name
+        ranking = self._ranking
+        if ranking is None:
+            self._top_version += 1
+        else:
+            was_top = (old_points is not None
+                       and ranking.rank(user_id, old_points) <= TOP_SIZE)
+            ranking.update(user_id, old_points, stats['points'])
+            if was_top or ranking.rank(user_id, stats['points']) <= TOP_SIZE:
+                self._top_version += 1
+        if self._journal is not None:
+            self._journal.append((user_id, old_points, stats['points']))
+        self.store.put('global_stats', user_id,
+                       (user_id, stats['points'], stats['games_played'],
+                        stats['name']))
+        return stats
+
+    _RANKED = ("SELECT user_id, points FROM global_stats "
+               "ORDER BY points DESC, user_id")
+
+    @staticmethod
+    def _build_ranking(rows, cached):
+        # Rows of cached users may not be flushed yet, so their points
+        # come from the cache instead
+        ranking = RankIndex()
+        ranking.build((user_id, points) for user_id, points in rows
+                      if user_id not in cached)
+        for user_id, points in cached.items():
+            ranking.add(user_id, points)
+        return ranking
+
+    def _cached_points(self):
+        return {
+            user_id: stats['points']
+            for user_id, stats in self._cache.items()
+        }
+
+    def load_ranking(self):
+        """Build the rank index from the database if it is not built yet."""
+        if self._ranking is None:
+            self._ranking = self._build_ranking(
+                self.store.iter_rows(self._RANKED), self._cached_points())
+        return self._ranking
+
+    async def load_ranking_in_background(self):
+        """Build the rank index on a thread while updates are handled.
+
+        The rows come from one read snapshot and the games recorded while
+        they are read are replayed on top, so startup does not wait for a
+        scan of every player. Until then top() and rank() use SQL.
+        """
+        if self._ranking is not None or self._journal is not None:
+            return
+        self.store.connect()
+        db = sqlite3.connect(self.store.path, check_same_thread=False)
+        db.execute("BEGIN")
+        # Executing steps the query, which fixes the snapshot right here
+        cursor = db.execute(self._RANKED)
+        cached = self._cached_points()
+        self._journal = []
+        started = time.perf_counter()
+        try:
+            ranking = await asyncio.to_thread(self._read_ranking, db, cursor,
+                                              cached)
+        except Exception as e:
+            logger.error(f"Error in load_ranking_in_background: {e}")
+            return
+        finally:
+            journal, self._journal = self._journal, None
+        for user_id, old_points, new_points in journal:
+            ranking.update(user_id, old_points, new_points)
+        if self._ranking is None:
+            self._ranking = ranking
+            self._top_version += 1
+        logger.info(f"Ranked {len(ranking)} players in "
+                    f"{time.perf_counter() - started:.2f}s")
+
+    def _read_ranking(self, db, cursor, cached):
+        try:
+            return self._build_ranking(
+                (row for rows in iter(lambda: cursor.fetchmany(1000), [])
+                 for row in rows), cached)
+        finally:
+            db.close()
+
+    def _ranking_ready(self):
+        """The rank index, or None while it is built in the background."""
+        if self._ranking is None and self._journal is not None:
+            return None
+        return self.load_ranking()
+
+    def _top_from_db(self, limit):
+        rows = self.store.query(
+            "SELECT user_id, points, games_played, name FROM global_stats "
+            "ORDER BY points DESC, user_id LIMIT ?", (limit, ))
+        return [(row[0], self._cache.get(row[0]) or self._from_row(row))
+                for row in rows]
+
+    def _rank_from_db(self, user_id, points):
+        ahead = self.store.query(
+            "SELECT COUNT(*) FROM global_stats WHERE points > ? "
+            "OR (points = ? AND user_id < ?)", (points, points, user_id))
+        return ahead[0][0] + 1
+
+    def top(self, limit):
+        """Return [(user_id, stats)] of the best players, highest first."""
+        ranking = self._ranking_ready()
+        if ranking is None:
+            return self._top_from_db(limit)
+        return [(user_id, self.get(user_id))
+                for user_id, _ in ranking.top(limit)]
+
+    def rank(self, user_id):
+        """Return the 1-based position of a user, or None."""
+        stats = self.get(user_id)
+        if stats is None:
+            return None
+        ranking = self._ranking_ready()
+        if ranking is None:
+            return self._rank_from_db(user_id, stats['points'])
+        return ranking.rank(user_id, stats['points'])
+
+    def __len__(self):
+        if self._ranking is not None:
+            return len(self._ranking)
+        return self.store.query("SELECT COUNT(*) FROM global_stats")[0][0]
+
+
+class SharedStatsStore(StatsStore):
+    """StatsStore for several processes writing the same database.
+
+    Games only queue point deltas, added to the stored totals on flush, and
+    reads go to the database so every shard sees the others' results within
+    one flush interval. Ranks are counted on the (points, user_id) index.
+    """
+
+    _DELTAS = 'global_stats_delta'
+
+    @property
+    def top_version(self):
+        # Other shards change the top too; it is re-read once per flush
+        return int(time.monotonic() // self.store.flush_interval)
+
+    def get(self, user_id):
+        rows = self.store.query(
+            "SELECT user_id, points, games_played, name "
+            "FROM global_stats WHERE user_id = ?", (user_id, ))
+        stats = self._from_row(rows[0]) if rows else None
+        # Include this process's games that are not flushed yet
+        queued = self.store.pending(self._DELTAS, user_id)
+        if queued is not None:
+            if stats is None:
+                stats = {'points': 0, 'games_played': 0, 'name': None}
+            stats['points'] += queued[1]
+            stats['games_played'] += queued[2]
+            stats['name'] = queued[3] or stats['name']
+        return stats
+
+    def record_game(self, user_id, points, name):
+        self.store.put(self._DELTAS, user_id, (user_id, points, 1, name or None))
+        return self.get(user_id)
+
+    def load_ranking(self):
+        return None
+
+    async def load_ranking_in_background(self):
+        pass
+
+    def top(self, limit):
+        return self._top_from_db(limit)
+
+    def rank(self, user_id):
+        stats = self.get(user_id)
+        if stats is None:
+            return None
+        return self._rank_from_db(user_id, stats['points'])
+
+    def __len__(self):
+        return self.store.query("SELECT COUNT(*) FROM global_stats")[0][0]
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence that stores one row per user, chat and bot_data key.
+
+    PTB only hands over the users and chats whose data changed, so a flush
+    costs O(changed records) instead of rewriting everything. User and chat
+    data are not read at startup; each record is loaded the first time PTB
+    refreshes it before handling an update, so startup does not grow with
+    the number of users.
+    """
+
+    def __init__(self, store, update_interval=FLUSH_INTERVAL):
+        super().__init__(store_data=PersistenceInput(callback_data=False),
+                         update_interval=update_interval)
+        self.store = store
+        self._bot_data_rows = {}  # {key: pickled value} as last written
+        self._loaded = {'user_data': set(), 'chat_data': set()}
+
+    @staticmethod
+    def _load_blobs(rows):
+        data = {}
+        for key, blob in rows:
+            try:
+                data[key] = pickle.loads(blob)
+            except Exception as e:
+                logger.error(f"Skipping unreadable record {key}: {e}")
+        return data
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    def _refresh(self, table, column, key, data):
+        loaded = self._loaded[table]
+        if key in loaded:
+            return
+        loaded.add(key)
+        rows = self.store.query(
+            f"SELECT {column}, data FROM {table} WHERE {column} = ?", (key, ))
+        # Anything set before the first refresh wins over the stored copy
+        for name, value in self._load_blobs(rows).get(key, {}).items():
+            data.setdefault(name, value)
+
+    async def get_bot_data(self):
+        rows = self.store.query("SELECT key, data FROM bot_data")
+        self._bot_data_rows = dict(rows)
+        return self._load_blobs(rows)
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_user_data(self, user_id, data):
+        self.store.put('user_data', user_id, (user_id, pickle.dumps(data)))
+
+    async def update_chat_data(self, chat_id, data):
+        self.store.put('chat_data', chat_id, (chat_id, pickle.dumps(data)))
+
+    async def update_bot_data(self, data):
+        # PTB passes the whole dict, only write the keys that changed
+        for key, value in data.items():
+            blob = pickle.dumps(value)
+            if self._bot_data_rows.get(key) != blob:
+                self._bot_data_rows[key] = blob
+                self.store.put('bot_data', key, (key, blob))
+        for key in set(self._bot_data_rows) - set(data):
+            del self._bot_data_rows[key]
+            self.store.delete('bot_data', key)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        self._loaded['chat_data'].add(chat_id)
+        self.store.delete('chat_data', chat_id)
+
+    async def drop_user_data(self, user_id):
+        self._loaded['user_data'].add(user_id)
+        self.store.delete('user_data', user_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        self._refresh('user_data', 'user_id', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self._refresh('chat_data', 'chat_id', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await self.store.flush()
+
+
+def import_legacy_pickle(store, path=LEGACY_PICKLE_FILE):
+    """Copy a PicklePersistence file into an empty database, once."""
+    if not os.path.exists(path):
+        return False
+    if any(
+            store.query(f"SELECT 1 FROM {table} LIMIT 1")
+            for table in ('user_data', 'chat_data', 'bot_data',
+                          'global_stats')):
+        return False
+
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+
+    for user_id, value in (data.get('user_data') or {}).items():
+        store.put('user_data', user_id, (user_id, pickle.dumps(dict(value))))
+    for chat_id, value in (data.get('chat_data') or {}).items():
+        store.put('chat_data', chat_id, (chat_id, pickle.dumps(dict(value))))
+    bot_data = dict(data.get('bot_data') or {})
+    for user_id, stats in bot_data.pop('global_stats', {}).items():
+        store.put('global_stats', user_id,
+                  (user_id, stats.get('points', 0),
+                   stats.get('games_played', 0), stats.get('name')))
+    for key, value in bot_data.items():
+        store.put('bot_data', key, (key, pickle.dumps(value)))
+    store.flush_sync()
+    logger.info(f"Imported legacy persistence file {path}")
+    return True
+
+
+storage = SQLiteStore()
+stats_store = SharedStatsStore(storage) if SHARDS > 1 else StatsStore(storage)
@@ -0,0 +1,85 @@
+"""Round timeouts count rounds nobody played and end abandoned games.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Configure the bot before importing it
+_workdir = tempfile.mkdtemp(prefix="anagram-test-")
+os.environ.setdefault('BOT_DB', os.path.join(_workdir, 'bot.db'))
+os.environ.setdefault('DEFINITIONS_DB', os.path.join(_workdir, 'defs.db'))
+os.environ.setdefault('EVENT_LOG', '')
+
+import main  # noqa: E402
+from game import GameState  # noqa: E402
+from prefetch import RoundPrefetcher  # noqa: E402
+
+CHAT_ID = -4242
+
+
+class FakeBot:
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+
+async def no_meaning(word):
+    return None
+
+
+class RoundTimeoutTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        # Rounds come from a fixed word, with no dictionary lookups
+        prefetcher = RoundPrefetcher(lambda *args: "listen",
+                                     lambda word, rng: "tinsel", no_meaning)
+        patcher = mock.patch.object(main, "prefetcher", prefetcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bot = FakeBot()
+        self.game = main.active_games[CHAT_ID] = GameState(10, "easy")
+        self.addCleanup(main.active_games.pop, CHAT_ID, None)
+        await main.next_round(CHAT_ID, self.bot)
+
+    async def time_out(self):
+        self.game.cancel_deadline()
+        await main.round_timed_out(CHAT_ID, self.game, self.game.round,
+                                   self.bot)
+
+    async def test_rounds_nobody_played_end_the_game(self):
+        for _ in range(main.MAX_MISSED_ROUNDS - 1):
+            await self.time_out()
+            self.assertIs(main.active_games.get(CHAT_ID), self.game)
+        await self.time_out()
+        self.assertNotIn(CHAT_ID, main.active_games)
+        self.assertEqual(self.game.round, main.MAX_MISSED_ROUNDS + 1)
+
+    async def test_rounds_nobody_played_leave_ratings_alone(self):
+        rating = main.difficulty_model.rating("listen")
+        await self.time_out()
+        self.assertEqual(main.difficulty_model.rating("listen"), rating)
+
+    async def test_a_played_round_resets_the_count(self):
+        await self.time_out()
+        self.assertEqual(self.game.missed_rounds, 1)
+        self.assertFalse(self.game.played)
+        self.game.touch()  # A wrong guess
+        await self.time_out()
+        self.assertEqual(self.game.missed_rounds, 0)
+        self.assertFalse(self.game.played)
+        self.assertIs(main.active_games.get(CHAT_ID), self.game)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Webhook updates that cannot answer a round are dropped unparsed.
+
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Configure the bot before importing it
+_workdir = tempfile.mkdtemp(prefix="anagram-test-")
+os.environ.setdefault('BOT_DB', os.path.join(_workdir, 'bot.db'))
+os.environ.setdefault('DEFINITIONS_DB', os.path.join(_workdir, 'defs.db'))
+os.environ.setdefault('EVENT_LOG', '')
+
+import main  # noqa: E402
+import webhook  # noqa: E402
+from webhook import WebhookInbox, chat_key  # noqa: E402
+
+CHAT_ID = -5151
+
+
+def message(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": CHAT_ID, "type": "group", "title": "Test"},
+            "from": {"id": 7, "is_bot": False, "first_name": "Player"},
+            "text": text,
+        },
+    }
+
+
+class FakeBot:
+
+    async def set_webhook(self, url, **kwargs):
+        self.webhook = url
+
+
+class FakeApplication:
+
+    def __init__(self):
+        self.bot = FakeBot()
+        self.processed = []
+
+    async def process_update(self, update):
+        self.processed.append(update.update_id)
+
+    async def initialize(self):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+async def nothing(application):
+    pass
+
+
+class WebhookPrefilterTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.inbox = WebhookInbox()
+        for name, value in (("inbox", self.inbox), ("post_init", nothing),
+                            ("post_stop", nothing),
+                            ("post_shutdown", nothing)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        parse = mock.patch.object(webhook.Update, "de_json",
+                                  wraps=webhook.Update.de_json)
+        self.de_json = parse.start()
+        self.addCleanup(parse.stop)
+        self.application = FakeApplication()
+        self.task = asyncio.create_task(
+            main.run_webhook(self.application, "https://example.test/hook"))
+        self.addAsyncCleanup(self.stop)
+
+    async def stop(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    async def test_chatter_without_a_game_is_never_parsed(self):
+        self.assertNotIn(CHAT_ID, main.active_games)
+        chatter = message(1, "hello there")
+        command = message(2, "/start")
+        command["message"]["entities"] = [{
+            "type": "bot_command",
+            "offset": 0,
+            "length": 6
+        }]
+        self.assertTrue(self.inbox.offer(chatter))
+        self.assertTrue(self.inbox.offer(command))
+        await asyncio.wait_for(self.inbox.settle(chat_key(chatter)), 5)
+
+        self.assertEqual(self.application.processed, [2])
+        parsed = [call.args[0] for call in self.de_json.call_args_list]
+        self.assertEqual(parsed, [command])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""Webhook mode: updates arrive on the keep-alive server and are handled
+in batches on the bot's event loop.
+
+Flask threads only append raw update dicts to a bounded inbox. When it is
+full they answer 503 and Telegram retries later, so a slow bot pushes back
+instead of buffering without limit. The drain task takes batches, groups
+them by chat and chains each chat's updates behind the previous ones, so
+chats are handled concurrently but every chat sees its updates in order.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+
+from telegram import Update
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Public base URL Telegram should post to; webhook mode is on when it is set
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = '/webhook'
+# Posts must carry this token; a random one is made when it is not set
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '10000'))
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '100'))
+
+rejected_updates = registry.counter(
+    "anagram_webhook_rejected_total",
+    "Webhook updates refused with 503 because the inbox was full.")
+batch_sizes = registry.histogram("anagram_webhook_batch_size",
+                                 "Updates taken from the inbox per batch.",
+                                 buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+
+
+def chat_key(data):
+    """Chat id of a raw update, falling back to the sender, or None."""
+    for field, value in data.items():
+        if field == 'update_id' or not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender.get('id')
+    return None
+
+
+class WebhookInbox:
+    """Bounded, thread-safe queue of raw updates with per-chat ordering."""
+
+    def __init__(self,
+                 max_size=WEBHOOK_QUEUE_SIZE,
+                 batch_size=WEBHOOK_BATCH_SIZE,
+                 max_in_flight=256):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.prefilter = None  # raw update -> False to drop it unparsed
+        # Token posts must carry; None while not in webhook mode
+        self.secret = None
+        self._items = deque()  # (chat key, update dict)
+        self._lock = threading.Lock()
+        self._unfinished = defaultdict(int)  # {chat key: updates not done}
+        self._loop = None
+        self._wakeup = None
+        self._slots = None
+        self._chains = {}  # {chat key: task handling its latest updates}
+        self._waiters = defaultdict(list)  # {chat key: [futures]}
+
+    def __len__(self):
+        return len(self._items)
+
+    def offer(self, data):
+        """Queue an update from any thread. False means the inbox is full."""
+        key = chat_key(data)
+        with self._lock:
+            if len(self._items) >= self.max_size:
+                rejected_updates.inc()
+                return False
+            was_empty = not self._items
+            self._items.append((key, data))
+            self._unfinished[key] += 1
+            loop, wakeup = self._loop, self._wakeup
+        if was_empty and loop is not None:
+            loop.call_soon_threadsafe(wakeup.set)
+        return True
+
+    def _take_batch(self):
+        with self._lock:
+            count = min(self.batch_size, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+    async def drain(self, application):
+        """Hand queued updates to the application until cancelled."""
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()  # Pick up anything queued before the loop
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                batch_sizes.observe(len(batch))
+                groups = defaultdict(list)
+                for key, data in batch:
+                    if self.prefilter is None or self.prefilter(data):
+                        groups[key].append(data)
+                    else:
+                        self._done(key)
+                for key, updates in groups.items():
+                    # Stop draining while every slot is busy; the inbox
+                    # then fills up and Flask starts answering 503
+                    await self._slots.acquire()
+                    previous = self._chains.get(key)
+                    task = asyncio.create_task(
+                        self._handle(application, key, updates, previous))
+                    self._chains[key] = task
+
+    async def _handle(self, application, key, updates, previous):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            for data in updates:
+                try:
+                    await application.process_update(
+                        Update.de_json(data, application.bot))
+                except Exception as e:
+                    logger.error(f"Error in webhook update: {e}")
+                finally:
+                    self._done(key)
+        finally:
+            self._slots.release()
+            if self._chains.get(key) is asyncio.current_task():
+                del self._chains[key]
+
+    def _done(self, key):
+        with self._lock:
+            self._unfinished[key] -= 1
+            if self._unfinished[key]:
+                return
+            del self._unfinished[key]
+        for waiter in self._waiters.pop(key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def settle(self, key):
+        """Wait until every update queued so far for a chat is handled."""
+        with self._lock:
+            if not self._unfinished.get(key):
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[key].append(waiter)
+        await waiter
+
+
+inbox = WebhookInbox()
@@ -0,0 +1,194 @@
+"""Local word bank so picking a round word never waits on the network."""
+import asyncio
+import logging
+import os
+import random
+import threading
+
+from http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+# Word length ranges by difficulty
+LENGTH_RANGES = {"easy": (4, 6), "medium": (6, 9), "hard": (8, 12)}
+MIN_LENGTH = min(low for low, _ in LENGTH_RANGES.values())
+MAX_LENGTH = max(high for _, high in LENGTH_RANGES.values())
+
+WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'words.txt')
+
+# Remote sources, only used by the optional background refill. A comma
+# separated WORD_API_URLS with {length} and {count} placeholders overrides them.
+REFILL_ENDPOINTS = [
+    url for url in os.getenv('WORD_API_URLS', '').split(',') if url
+] or [
+    "https://random-word-api.herokuapp.com/word?length={length}&number={count}",
+    "https://random-word-api.vercel.app/api?length={length}&words={count}",
+]
+
+
+class _Bucket:
+    """All words of one length, packed back to back in a sorted bytearray."""
+
+    __slots__ = ("length", "data")
+
+    def __init__(self, length):
+        self.length = length
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data) // self.length
+
+    def __getitem__(self, index):
+        start = index * self.length
+        return self.data[start:start + self.length].decode('ascii')
+
+    def _find(self, word):
+        """Binary search for word, returns (index, found)."""
+        encoded = word.encode('ascii')
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            start = mid * self.length
+            current = bytes(self.data[start:start + self.length])
+            if current < encoded:
+                low = mid + 1
+            else:
+                high = mid
+        start = low * self.length
+        return low, self.data[start:start + self.length] == encoded
+
+    def __contains__(self, word):
+        return self._find(word)[1]
+
+    def insert(self, word):
+        """Insert word keeping the bucket sorted, returns False if present."""
+        index, found = self._find(word)
+        if found:
+            return False
+        start = index * self.length
+        self.data[start:start] = word.encode('ascii')
+        return True
+
+
+class WordBank:
+    """Words indexed by length with O(1) random selection per difficulty."""
+
+    def __init__(self):
+        self._buckets = {
+            length: _Bucket(length)
+            for length in range(MIN_LENGTH, MAX_LENGTH + 1)
+        }
+        self._lock = threading.Lock()
+        self.on_add = None  # called with every word added after load
+
+    @staticmethod
+    def _valid(word):
+        return (word.isascii() and word.isalpha()
+                and MIN_LENGTH <= len(word) <= MAX_LENGTH)
+
+    def load(self, path=WORDS_FILE):
+        """Load a word list file with one word per line."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                words = sorted({
+                    word
+                    for word in (line.strip().lower() for line in f)
+                    if self._valid(word)
+                })
+        except OSError as e:
+            logger.error(f"Failed to load word list {path}: {e}")
+            return 0
+
+        # The words are sorted, so each bucket can be filled by appending
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.data = bytearray()
+            for word in words:
+                self._buckets[len(word)].data += word.encode('ascii')
+        logger.info(f"Loaded {len(words)} words from {path}")
+        return len(words)
+
+    def add(self, word):
+        """Add a single word, returns True if it was new."""
+        word = word.strip().lower()
+        if not self._valid(word):
+            return False
+        with self._lock:
+            added = self._buckets[len(word)].insert(word)
+        if added and self.on_add is not None:
+            self.on_add(word)
+        return added
+
+    def __contains__(self, word):
+        bucket = self._buckets.get(len(word))
+        return bucket is not None and word.isascii() and word in bucket
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def __iter__(self):
+        for bucket in self._buckets.values():
+            for index in range(len(bucket)):
+                yield bucket[index]
+
+    def count(self, length):
+        bucket = self._buckets.get(length)
+        return len(bucket) if bucket else 0
+
+    def word_of_length(self, length, rng=random):
+        """Pick a random word of exactly `length` letters, or None."""
+        bucket = self._buckets.get(length)
+        if not bucket:
+            return None
+        return bucket[rng.randrange(len(bucket))]
+
+    def random_word(self, difficulty="medium", rng=random):
+        """Pick a random word for the difficulty, or None if none are loaded."""
+        min_len, max_len = LENGTH_RANGES[difficulty]
+        target_length = rng.randint(min_len, max_len)
+        bucket = self._buckets[target_length]
+        if not len(bucket):
+            # Try the other lengths of the range before giving up
+            lengths = [
+                length for length in range(min_len, max_len + 1)
+                if len(self._buckets[length])
+            ]
+            if not lengths:
+                return None
+            bucket = self._buckets[rng.choice(lengths)]
+        return bucket[rng.randrange(len(bucket))]
+
+    async def refill_from_remote(self, count=50):
+        """Fetch extra words from the remote APIs, returns how many were new."""
+        added = 0
+        for length in range(MIN_LENGTH, MAX_LENGTH + 1):
+            for endpoint in REFILL_ENDPOINTS:
+                url = endpoint.format(length=length, count=count)
+                try:
+                    response = await http_client.get(url)
+                    if response.status_code != 200:
+                        continue
+                    words = response.json()
+                    if isinstance(words, list):
+                        added += sum(
+                            self.add(word) for word in words
+                            if isinstance(word, str))
+                        break
+                except Exception as e:
+                    logger.warning(f"Failed to fetch words from {url}: {e}")
+        return added
+
+    async def refill_forever(self, interval):
+        """Periodically top up the bank from the remote APIs, run as a task."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                added = await self.refill_from_remote()
+                if added:
+                    logger.info(f"Word bank refill added {added} words")
+            except Exception as e:
+                logger.error(f"Error refilling word bank: {e}")
+
+
+word_bank = WordBank()